@@ -0,0 +1,118 @@
+import numpy as np
+from ant import Ant
+from pheromone_map import PheromoneMap, PheromoneType, evaporate_diffuse
+
+# Backends by name; 'auto' is resolved when a simulation starts
+BACKENDS = ('numpy', 'numba', 'auto')
+
+
+class NumpyBackend:
+    # The per-tick kernels as batched NumPy operations: steering and moving the ants, laying their
+    # trails and the evaporate+diffuse step. Works with every kind of pheromone store. Random numbers
+    # are drawn by the caller and passed in, so every backend gives the same run for the same seed.
+    name = 'numpy'
+
+    def move_ants(self, swarm, pheromone_map, obstacles, nest_headings, random_rolls, random_angles):
+        # Steer every ant (wander, follow RETURN pheromone or head home), turn, move, and get stuck ants unstuck
+        n = swarm.count
+        positions = swarm.positions[:n]
+        headings = swarm.headings[:n]
+        states = swarm.states[:n]
+        stuck_time = swarm.stuck_time[:n]
+
+        # Decide where every ant wants to go
+        exploring = states == Ant.EXPLORING
+        wander = exploring & (random_rolls < swarm.random_movement_chance)
+        sensing = exploring & ~wander
+        desired = nest_headings
+        desired[wander] = random_angles[0, wander]
+        if sensing.any():
+            desired[sensing] = swarm.sense_pheromones(pheromone_map, PheromoneType.RETURN, sensing)
+
+        # Turn toward the desired heading, limited to max_turn_angle per tick
+        angle_diff = (desired - headings + np.pi) % (2 * np.pi) - np.pi
+        headings += np.clip(angle_diff, -swarm.max_turn_angle, swarm.max_turn_angle)
+        headings[:] = (headings + np.pi) % (2 * np.pi) - np.pi
+
+        # Try to move to the new positions
+        new_positions = positions + swarm.speed * np.column_stack((np.cos(headings), np.sin(headings)))
+        valid = swarm.valid_positions(new_positions, obstacles)
+        positions[valid] = new_positions[valid]
+        stuck_time[valid] = 0
+        stuck_time[~valid] += 1
+
+        # If stuck, get unstuck
+        unstuck = stuck_time > swarm.stuck_limit
+        headings[unstuck] = random_angles[1, unstuck]
+        stuck_time[unstuck] = 0
+
+    def deposit_trails(self, pheromone_map, positions, states):
+        # Exploring ants mark SEARCH, returning ants RETURN, one unit per ant on the cell it stands on
+        exploring = states == Ant.EXPLORING
+        pheromone_map.deposit_pheromones(positions[exploring], PheromoneType.SEARCH)
+        pheromone_map.deposit_pheromones(positions[~exploring], PheromoneType.RETURN)
+
+    def evaporate_diffuse(self, pheromone_map, neighbour_weight):
+        evaporate_diffuse(pheromone_map, neighbour_weight)
+
+
+class NumbaBackend(NumpyBackend):
+    # The same kernels as compiled per-ant and per-cell loops (numba_kernels.py), which skip the
+    # temporary arrays and masks of the NumPy version. They need a dense PheromoneMap; ants on any other
+    # store (the tiled map, a rival colony's Grid slice, a parallel worker's strip) use the NumPy kernels.
+    name = 'numba'
+
+    def __init__(self):
+        import numba_kernels
+        self.kernels = numba_kernels
+
+    def move_ants(self, swarm, pheromone_map, obstacles, nest_headings, random_rolls, random_angles):
+        if not isinstance(pheromone_map, PheromoneMap):
+            return super().move_ants(swarm, pheromone_map, obstacles, nest_headings, random_rolls, random_angles)
+        n = swarm.count
+        self.kernels.move_ants(swarm.positions[:n], swarm.headings[:n], swarm.states[:n], swarm.stuck_time[:n],
+                               nest_headings, random_rolls, random_angles,
+                               pheromone_map.pheromones[PheromoneType.RETURN], obstacles.solid,
+                               float(swarm.random_movement_chance), float(swarm.sensor_offset_distance),
+                               float(swarm.sensor_angle_offset), float(swarm.max_turn_angle), float(swarm.speed),
+                               int(swarm.stuck_limit), swarm.grid_width, swarm.grid_height)
+
+    def deposit_trails(self, pheromone_map, positions, states):
+        if not isinstance(pheromone_map, PheromoneMap):
+            return super().deposit_trails(pheromone_map, positions, states)
+        self.kernels.deposit_trails(pheromone_map.pheromones[PheromoneType.SEARCH],
+                                    pheromone_map.pheromones[PheromoneType.RETURN], positions, states)
+
+    def evaporate_diffuse(self, pheromone_map, neighbour_weight):
+        solid = pheromone_map.obstacles.solid if pheromone_map.boundary == 'obstacle' else None
+        self.kernels.evaporate_diffuse(pheromone_map.field, pheromone_map.back, pheromone_map.self_weight,
+                                       pheromone_map.field.dtype.type(neighbour_weight),
+                                       pheromone_map.boundary == 'wrap', solid)
+
+
+NUMPY = NumpyBackend()
+_numba = None
+
+
+def numba_available():
+    try:
+        import numba  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_backend(name='auto'):
+    # The backend for a name in BACKENDS; 'auto' is Numba when it is installed, NumPy otherwise.
+    # The Numba kernels are compiled (or loaded from the on-disk cache) on first use.
+    global _numba
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {BACKENDS}")
+    if name == 'numpy' or (name == 'auto' and not numba_available()):
+        return NUMPY
+    if not numba_available():
+        raise ValueError("The numba backend needs the numba package (pip install numba)")
+    if _numba is None:
+        _numba = NumbaBackend()
+    return _numba
+
@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # draw benchmarks must not need a display
+import numpy as np
+import pygame
+from backend import BACKENDS, get_backend
+from config import SimulationConfig
+from food import Food
+from obstacle import Obstacle
+from pheromone_map import PheromoneRenderer
+from profiler import Profiler
+from renderer import SceneRenderer
+from simulation import GRID_WIDTH, GRID_HEIGHT, CELL_SIZE, Simulation
+
+# Bumped whenever the layout of the results file changes
+RESULTS_VERSION = 2
+
+# Every scenario starts from BASE_SCENARIO and changes one axis
+BASE_SCENARIO = {'ants': 1000, 'width': GRID_WIDTH, 'height': GRID_HEIGHT, 'obstacles': 0, 'foods': 10, 'draw': False}
+SWEEPS = {
+    'quick': {
+        'ants': [100, 1000, 10000],
+        'grid': [(GRID_WIDTH, GRID_HEIGHT), (512, 512)],
+        'obstacles': [0, 100],
+        'foods': [0, 100],
+        'draw': [1000],
+    },
+    'full': {
+        'ants': [100, 1000, 10000, 100000],
+        'grid': [(GRID_WIDTH, GRID_HEIGHT), (512, 512), (1024, 1024), (2048, 2048)],
+        'obstacles': [0, 100, 1000],
+        'foods': [0, 10, 100, 1000],
+        'draw': [100, 1000, 10000],
+    },
+}
+
+
+def scenarios(suite):
+    # Expand a sweep into named scenarios, one per value of each axis
+    sweep = SWEEPS[suite]
+    result = {}
+    for ants in sweep['ants']:
+        result[f'ants_{ants}'] = dict(BASE_SCENARIO, ants=ants)
+    for width, height in sweep['grid']:
+        result[f'grid_{width}x{height}'] = dict(BASE_SCENARIO, width=width, height=height)
+    for obstacles in sweep['obstacles']:
+        result[f'obstacles_{obstacles}'] = dict(BASE_SCENARIO, obstacles=obstacles)
+    for foods in sweep['foods']:
+        result[f'foods_{foods}'] = dict(BASE_SCENARIO, foods=foods)
+    for ants in sweep['draw']:
+        result[f'draw_{ants}'] = dict(BASE_SCENARIO, ants=ants, draw=True)
+    return result
+
+
+class BenchWorld:
+    # A headless Simulation set up for a scenario. Its ticks are the engine's own Simulation.update, so
+    # the phases timed here are the ones its profiler sees in a real run.
+    def __init__(self, scenario, seed=0, backend='numpy', window=500):
+        width, height = scenario['width'], scenario['height']
+        rng = np.random.default_rng(seed)
+        # max_ants is the scenario's ant count, so the spawn phase runs but the swarm keeps its size
+        config = SimulationConfig(max_ants=scenario['ants'], backend=backend)
+        self.sim = sim = Simulation(headless=True, seed=seed, config=config, grid_size=(width, height))
+        sim.paused = False
+        sim.profiler = Profiler(window)
+        for _ in range(scenario['obstacles']):
+            sim.obstacles.add(Obstacle(int(rng.integers(0, width - 3)), int(rng.integers(0, height - 3)), 3))
+        sim.foods.extend([Food(int(rng.integers(0, width - 3)), int(rng.integers(0, height - 3)), 3)
+                          for _ in range(scenario['foods'])])
+
+        # Ants start spread over the free cells so every phase sees a settled-looking swarm
+        count = scenario['ants']
+        positions = rng.uniform((0, 0), (width, height), (count, 2))
+        positions = positions[~sim.obstacles.are_solid(positions)]
+        sim.swarm.add_ants(positions, rng.uniform(-np.pi, np.pi, len(positions)),
+                           rng.integers(0, 2, len(positions)).astype(np.int8),
+                           np.zeros(len(positions), dtype=np.int32))
+
+        self.scene = None
+        if scenario['draw']:
+            self.scene = SceneRenderer(width * CELL_SIZE, height * CELL_SIZE, CELL_SIZE, sim.nest_size)
+            sim.pheromone_map.renderer = PheromoneRenderer(sim.pheromone_map, CELL_SIZE)
+
+    def tick(self):
+        # One Simulation.update, plus drawing the world off-screen for draw scenarios
+        sim = self.sim
+        sim.update()
+        if self.scene is not None:
+            with sim.profiler.phase('draw'):
+                self.scene.draw(sim, sim.obstacle_version, sim.profiler)
+
+
+def run_scenario(scenario, min_time=1.0, min_ticks=5, max_ticks=500, warmup=3, seed=0, backend='numpy'):
+    # The world is built and warmed up under tracemalloc for the peak memory. The warmup ticks also
+    # compute the nest distance field and compile (or load from the cache) the kernels of a JIT backend.
+    tracemalloc.start()
+    world = BenchWorld(scenario, seed, backend, window=max_ticks)
+    for _ in range(warmup):
+        world.tick()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Timed pass: ticks are repeated until min_time has passed; the profiler times every phase
+    profiler = world.sim.profiler
+    profiler.reset()
+    ticks, start = 0, time.perf_counter()
+    while ticks < max_ticks and (ticks < min_ticks or time.perf_counter() - start < min_time):
+        world.tick()
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        'scenario': scenario,
+        'ticks': ticks,
+        'ants': len(world.sim.swarm),
+        'ticks_per_second': ticks / elapsed,
+        'phases_ms': {name: {'mean': values['mean'], 'p50': values['p50'], 'p95': values['p95']}
+                      for name, values in profiler.stats().items()},
+        'peak_memory_bytes': peak,
+    }
+
+
+def run_scaling(worker_counts, scenario, ticks=200, warmup=5, seed=0, log=print):
+    # Throughput of the parallel engine for each worker count, against the single-process engine.
+    # Near-linear scaling needs that many free cores; the environment records how many there were.
+    results = {'version': RESULTS_VERSION, 'environment': environment(), 'scenario': scenario, 'runs': []}
+    single = None
+    for workers in [0] + list(worker_counts):
+        world = BenchWorld(scenario, seed)
+        if workers:
+            world.sim.start_parallel(workers)
+        try:
+            for _ in range(warmup):
+                world.tick()
+            start = time.perf_counter()
+            for _ in range(ticks):
+                world.tick()
+            elapsed = time.perf_counter() - start
+        finally:
+            world.sim.stop_parallel()
+        ticks_per_second = ticks / elapsed
+        single = single or ticks_per_second
+        results['runs'].append({'workers': workers, 'ticks_per_second': ticks_per_second,
+                                'speedup': ticks_per_second / single})
+        log(f"{workers or 'single':>8} {ticks_per_second:>10.1f} ticks/s  {ticks_per_second / single:>5.2f}x")
+    return results
+
+
+def environment():
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'numba': numba_version,
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def run_suite(suite, only=None, min_time=1.0, max_ticks=500, log=print, backend='numpy'):
+    results = {'version': RESULTS_VERSION, 'suite': suite, 'backend': get_backend(backend).name,
+               'environment': environment(), 'scenarios': {}}
+    for name, scenario in scenarios(suite).items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        result = run_scenario(scenario, min_time=min_time, max_ticks=max_ticks, backend=backend)
+        results['scenarios'][name] = result
+        log(f"{name:<20} {result['ticks_per_second']:>10.1f} ticks/s  "
+            f"{result['peak_memory_bytes'] / 2**20:>8.1f} MiB peak  " +
+            ' '.join(f"{phase}={times['mean']:.2f}ms" for phase, times in result['phases_ms'].items()))
+    return results
+
+
+# Environment entries that have to match for two result files to be comparable
+COMPARABLE = ('python', 'numpy', 'numba', 'pygame', 'platform', 'processor', 'cpu_count')
+
+
+def mismatches(baseline, current):
+    # (what, baseline value, current value) for every difference in backend or environment
+    found = []
+    if baseline.get('backend') != current.get('backend'):
+        found.append(('backend', baseline.get('backend'), current.get('backend')))
+    for key in COMPARABLE:
+        before, after = baseline['environment'].get(key), current['environment'].get(key)
+        if before != after:
+            found.append((key, before, after))
+    return found
+
+
+def compare(baseline, current, threshold=0.1, memory_threshold=0.2, min_phase_ms=0.05):
+    # Regressions of current against baseline: lower throughput, slower phases or more peak memory.
+    # Phases faster than min_phase_ms are too noisy to judge and are skipped.
+    regressions = []
+    for name, result in current['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None or base['scenario'] != result['scenario']:
+            continue
+        ratio = result['ticks_per_second'] / base['ticks_per_second']
+        if ratio < 1 - threshold:
+            regressions.append((name, 'ticks_per_second', base['ticks_per_second'], result['ticks_per_second']))
+        for phase, times in result['phases_ms'].items():
+            base_times = base['phases_ms'].get(phase)
+            if base_times is None or base_times['p50'] < min_phase_ms:
+                continue
+            if times['p50'] > base_times['p50'] * (1 + threshold):
+                regressions.append((name, f'{phase} p50 ms', base_times['p50'], times['p50']))
+        if result['peak_memory_bytes'] > base['peak_memory_bytes'] * (1 + memory_threshold):
+            regressions.append((name, 'peak_memory_bytes', base['peak_memory_bytes'], result['peak_memory_bytes']))
+    return regressions
+
+
+def load_results(path):
+    with open(path) as file:
+        results = json.load(file)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"{path}: unsupported results version {results.get('version')}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tick throughput, scaling and render cost.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run the benchmark suite and write the results as JSON")
+    run.add_argument('--suite', choices=list(SWEEPS), default='quick')
+    run.add_argument('--only', action='append', metavar='TEXT',
+                     help="only run scenarios whose name contains TEXT (repeatable)")
+    run.add_argument('--min-time', type=float, default=1.0, help="seconds to time each scenario for")
+    run.add_argument('--max-ticks', type=int, default=500, help="tick limit per scenario")
+    run.add_argument('--backend', choices=BACKENDS, default='numpy',
+                     help="compute backend of the tick kernels; compare runs of each with the compare command")
+    run.add_argument('--output', default='benchmark_results.json')
+
+    scaling = commands.add_parser('scaling', help="measure how the parallel engine scales with workers")
+    scaling.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    scaling.add_argument('--ants', type=int, default=20000)
+    scaling.add_argument('--grid', type=int, nargs=2, default=(512, 512), metavar=('WIDTH', 'HEIGHT'))
+    scaling.add_argument('--ticks', type=int, default=200, help="timed ticks per worker count")
+    scaling.add_argument('--output', default='scaling_results.json')
+
+    check = commands.add_parser('compare', help="flag regressions of a result file against a baseline")
+    check.add_argument('baseline')
+    check.add_argument('current')
+    check.add_argument('--threshold', type=float, default=0.1,
+                       help="allowed relative slowdown before it counts as a regression")
+    check.add_argument('--memory-threshold', type=float, default=0.2,
+                       help="allowed relative growth of peak memory")
+    check.add_argument('--allow-mismatch', action='store_true',
+                       help="compare even if the backend or environment differ, e.g. numpy against numba")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run_suite(args.suite, args.only, args.min_time, args.max_ticks, backend=args.backend)
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+        return 0
+    if args.command == 'scaling':
+        scenario = dict(BASE_SCENARIO, ants=args.ants, width=args.grid[0], height=args.grid[1])
+        results = run_scaling(args.workers, scenario, args.ticks)
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+        return 0
+
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    different = mismatches(baseline, current)
+    for key, before, after in different:
+        print(f"{'DIFFERENT' if args.allow_mismatch else 'MISMATCH'} {key}: {before} -> {after}")
+    if different and not args.allow_mismatch:
+        print("Results are not comparable; pass --allow-mismatch to compare them anyway")
+        return 2
+    regressions = compare(baseline, current, args.threshold, args.memory_threshold)
+    for name, metric, before, after in regressions:
+        print(f"REGRESSION {name}: {metric} {before:.4g} -> {after:.4g}")
+    compared = sum(1 for name in current['scenarios'] if name in baseline['scenarios'])
+    print(f"{compared} scenarios compared, {len(regressions)} regressions")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
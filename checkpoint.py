@@ -0,0 +1,187 @@
+import json
+import threading
+import numpy as np
+from config import SimulationConfig
+from food import Food
+from obstacle import Obstacle
+from pheromone_map import PheromoneType
+from simulation import Simulation
+from swarm import Swarm
+from tiled_pheromone_map import TiledPheromoneMap
+
+# Bumped whenever the layout of the snapshot changes
+CHECKPOINT_VERSION = 1
+
+
+# Copy the full simulation state into plain arrays plus a JSON-able metadata dict.
+# This is the only part that runs on the simulation thread; writing happens elsewhere.
+def snapshot(sim):
+    if sim.parallel is not None:
+        # The workers' random generators are not part of a checkpoint, so it could not resume the run exactly
+        raise ValueError("Stop the parallel engine before taking a checkpoint")
+    arrays = {}
+    meta = {
+        'version': CHECKPOINT_VERSION,
+        'tick': sim.tick,
+        'spawn_timer': sim.spawn_timer,
+        'config': sim.config.to_dict(),
+        'colonies': [],
+    }
+
+    for colony in sim.colonies:
+        swarm, prefix = colony.swarm, f'colony{colony.colony_id}_'
+        n = swarm.count
+        arrays[prefix + 'positions'] = swarm.positions[:n].copy()
+        arrays[prefix + 'headings'] = swarm.headings[:n].copy()
+        arrays[prefix + 'states'] = swarm.states[:n].copy()
+        arrays[prefix + 'stuck_time'] = swarm.stuck_time[:n].copy()
+        meta['colonies'].append({
+            'colony_id': colony.colony_id,
+            'nest_position': [float(value) for value in colony.nest_position],
+            'food_delivered': swarm.food_delivered,
+            'rng_state': swarm.rng.bit_generator.state,
+            'parameters': {name: getattr(swarm, name) for name in Swarm.PARAMETERS},
+        })
+
+    pheromone_map = sim.pheromone_map
+    meta['pheromones'] = {
+        'evaporation_rate': pheromone_map.evaporation_rate,
+        'diffusion_rate': pheromone_map.diffusion_rate,
+        'tiled': isinstance(pheromone_map, TiledPheromoneMap),
+    }
+    if meta['pheromones']['tiled']:
+        keys = sorted(pheromone_map.tiles)
+        arrays['pheromone_tile_keys'] = np.array(keys, dtype=np.int64).reshape(-1, 2)
+        tile_shape = (len(PheromoneType.ALL), pheromone_map.tile_size, pheromone_map.tile_size)
+        tiles = [pheromone_map.tiles[key] for key in keys]
+        arrays['pheromone_tiles'] = np.array(tiles, dtype=pheromone_map.dtype).reshape((-1,) + tile_shape)
+    else:
+        arrays['pheromone_field'] = pheromone_map.field.copy()
+
+    grid = sim.grid
+    arrays['grid_pheromones'] = grid.pheromones.copy()
+    meta['grid'] = {
+        'pheromone_types': [[key, index] for key, index in grid.pheromone_types.items()],
+        'colonies': [[key, index] for key, index in grid.colonies.items()],
+        'decay_rate': grid.decay_rate,
+        'diffusion_rate': grid.diffusion_rate,
+    }
+
+    foods = list(sim.foods)
+    arrays['food_positions'] = np.array([food.position for food in foods]).reshape(-1, 2)
+    arrays['food_sizes'] = np.array([food.size for food in foods], dtype=np.int64)
+    arrays['food_amounts'] = np.array([food.amount for food in foods], dtype=np.int64)
+    arrays['food_initial_amounts'] = np.array([food.initial_amount for food in foods], dtype=np.int64)
+
+    obstacles = list(sim.obstacles)
+    arrays['obstacle_positions'] = np.array([obstacle.position for obstacle in obstacles]).reshape(-1, 2)
+    arrays['obstacle_sizes'] = np.array([obstacle.size for obstacle in obstacles], dtype=float)
+    arrays['obstacle_raster'] = sim.obstacles.solid.copy()
+    return arrays, meta
+
+
+def write_snapshot(path, arrays, meta, compress=False):
+    save = np.savez_compressed if compress else np.savez
+    save(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+class CheckpointWriter:
+    # Handle for a checkpoint being written in the background
+    def __init__(self, path, arrays, meta, compress):
+        self.path = path
+        self.error = None
+        self.thread = threading.Thread(target=self.write, args=(arrays, meta, compress), daemon=True)
+        self.thread.start()
+
+    def write(self, arrays, meta, compress):
+        try:
+            write_snapshot(self.path, arrays, meta, compress)
+        except Exception as error:
+            self.error = error
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def wait(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+# Save the simulation to an .npz file. The state is copied right away and, by default,
+# written by a background thread so the simulation loop only pays for the copy.
+def save_checkpoint(sim, path, background=True, compress=False):
+    arrays, meta = snapshot(sim)
+    if background:
+        return CheckpointWriter(path, arrays, meta, compress)
+    write_snapshot(path, arrays, meta, compress)
+    return None
+
+
+# Build a new simulation from a checkpoint; continuing it gives exactly the same run as the original
+def load_checkpoint(path, headless=True):
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        arrays = {key: data[key] for key in data.files if key != 'meta'}
+    if meta['version'] != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {meta['version']}")
+    config = SimulationConfig.from_dict(meta['config']) if 'config' in meta else None
+    grid_size = arrays['obstacle_raster'].shape[::-1]
+    sim = Simulation(headless=headless, tiled_pheromones=meta['pheromones']['tiled'], config=config, grid_size=grid_size)
+    restore(sim, arrays, meta)
+    return sim
+
+
+def restore(sim, arrays, meta):
+    sim.tick = meta['tick']
+    sim.spawn_timer = meta['spawn_timer']
+
+    # Add the rival colonies first: add_colony draws from the first colony's generator
+    for colony_meta in meta['colonies']:
+        if colony_meta['colony_id'] >= len(sim.colonies):
+            sim.add_colony(tuple(colony_meta['nest_position']))
+    for colony_meta in meta['colonies']:
+        colony_id = colony_meta['colony_id']
+        if list(sim.colonies[colony_id].nest_position) != colony_meta['nest_position']:
+            sim.move_nest(colony_id, tuple(colony_meta['nest_position']))
+        swarm, prefix = sim.colonies[colony_id].swarm, f'colony{colony_id}_'
+        swarm.remove_ants(np.ones(swarm.count, dtype=bool))
+        swarm.add_ants(arrays[prefix + 'positions'], arrays[prefix + 'headings'],
+                       arrays[prefix + 'states'], arrays[prefix + 'stuck_time'])
+        swarm.food_delivered = colony_meta['food_delivered']
+        swarm.rng.bit_generator.state = colony_meta['rng_state']
+        for name, value in colony_meta['parameters'].items():
+            setattr(swarm, name, value)
+
+    pheromone_map = sim.pheromone_map
+    pheromone_map.evaporation_rate = meta['pheromones']['evaporation_rate']
+    pheromone_map.diffusion_rate = meta['pheromones']['diffusion_rate']
+    if meta['pheromones']['tiled']:
+        pheromone_map.tiles = {}
+        for key, tile in zip(arrays['pheromone_tile_keys'], arrays['pheromone_tiles']):
+            pheromone_map.tiles[(int(key[0]), int(key[1]))] = tile.astype(pheromone_map.dtype)
+    else:
+        pheromone_map.field[...] = arrays['pheromone_field']
+        pheromone_map.bind_views()
+
+    grid = sim.grid
+    grid.pheromone_types = {key: index for key, index in meta['grid']['pheromone_types']}
+    grid.colonies = {key: index for key, index in meta['grid']['colonies']}
+    grid.pheromones = arrays['grid_pheromones'].astype(grid.dtype)
+    grid.resize()
+    grid.decay_rate = meta['grid']['decay_rate']
+    grid.diffusion_rate = meta['grid']['diffusion_rate']
+
+    sim.foods.foods = []
+    for position, size, amount, initial_amount in zip(arrays['food_positions'], arrays['food_sizes'],
+                                                      arrays['food_amounts'], arrays['food_initial_amounts']):
+        food = Food(position[0], position[1], int(size))
+        food.amount = int(amount)
+        food.initial_amount = int(initial_amount)
+        sim.foods.foods.append(food)
+    sim.foods.rebuild()
+
+    sim.obstacles.obstacles = [Obstacle(position[0], position[1], size)
+                               for position, size in zip(arrays['obstacle_positions'], arrays['obstacle_sizes'])]
+    sim.obstacles.solid[...] = arrays['obstacle_raster']
+    sim.obstacles.version += 1
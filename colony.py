@@ -0,0 +1,7 @@
+class Colony:
+    # A nest, the swarm of ants that lives in it and the pheromone field those ants sense and mark
+    def __init__(self, colony_id, nest_position, swarm, pheromones):
+        self.colony_id = colony_id
+        self.nest_position = nest_position
+        self.swarm = swarm
+        self.pheromones = pheromones
@@ -0,0 +1,95 @@
+import warnings
+import numpy as np
+from backend import get_backend
+from navigation import NavigationField, compiled_kernels
+from pheromone_map import PheromoneMap
+from swarm import Swarm
+
+
+class SimulationConfig:
+    # Per-run settings of a Simulation. Anything not given keeps the default below,
+    # which are the values the interactive simulation has always used.
+    DEFAULTS = {
+        # Spawning
+        'max_ants': 100,
+        'ant_spawn_rate': 70,
+        'ants_per_spawn': 10,
+        # Pheromones (used by the PheromoneMap and by the Grid of rival colonies)
+        'evaporation_rate': 0.995,
+        'diffusion_rate': 0.1,
+        # Ant movement, one entry per Swarm.PARAMETERS
+        'speed': 1.0,
+        'sensor_offset_distance': 3.0,
+        'sensor_angle_offset': np.pi / 6,
+        'max_turn_angle': np.pi / 4,
+        'random_movement_chance': 0.3,
+        'stuck_limit': 10,
+        'nest_radius': 1.0,
+        # Returning ants follow an obstacle-aware distance field home instead of a straight line.
+        # Without numba the field is marched in plain Python, so grids of more than
+        # navigation_max_cells cells then go without it (0 for no limit)
+        'nest_navigation': True,
+        'navigation_max_cells': 512 * 512,
+        # Compute backend of the per-tick kernels: 'numpy', 'numba' or 'auto' (see backend.py)
+        'backend': 'numpy',
+    }
+
+    def __init__(self, **values):
+        unknown = set(values) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown simulation settings: {', '.join(sorted(unknown))}")
+        for name, default in self.DEFAULTS.items():
+            setattr(self, name, values.get(name, default))
+
+    def __repr__(self):
+        changed = {name: value for name, value in self.to_dict().items() if value != self.DEFAULTS[name]}
+        return f"SimulationConfig({', '.join(f'{name}={value!r}' for name, value in changed.items())})"
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.DEFAULTS}
+
+    def replace(self, **values):
+        # Copy with some settings changed
+        return SimulationConfig(**dict(self.to_dict(), **values))
+
+    def apply_to_swarm(self, swarm):
+        for name in Swarm.PARAMETERS:
+            setattr(swarm, name, getattr(self, name))
+        swarm.backend = get_backend(self.backend)
+
+    def apply_navigation(self, swarm, obstacles, background=False):
+        # background=True computes the field on a thread (see NavigationField), for the window
+        swarm.navigation = None
+        if not self.nest_navigation:
+            return
+        cells = obstacles.width * obstacles.height
+        if self.navigation_max_cells and cells > self.navigation_max_cells and compiled_kernels() is None:
+            warnings.warn(f"Nest navigation is off on this {obstacles.width}x{obstacles.height} grid: without numba "
+                          f"it would take too long (pip install numba, or raise navigation_max_cells)")
+            return
+        swarm.navigation = NavigationField(obstacles, swarm.nest_position, background)
+
+    def apply_to_pheromones(self, pheromone_map, grid):
+        pheromone_map.evaporation_rate = self.evaporation_rate
+        pheromone_map.diffusion_rate = self.diffusion_rate
+        grid.decay_rate = self.evaporation_rate
+        grid.diffusion_rate = self.diffusion_rate
+        if isinstance(pheromone_map, PheromoneMap):
+            pheromone_map.evaporate_diffuse = get_backend(self.backend).evaporate_diffuse
+
+
+def parse_setting(text):
+    # NAME=VALUE from the command line; the value gets the type of the setting's default
+    name, _, value = text.partition('=')
+    if name not in SimulationConfig.DEFAULTS or not value:
+        raise ValueError(f"Expected NAME=VALUE with NAME one of {', '.join(SimulationConfig.DEFAULTS)}, got {text!r}")
+    default = SimulationConfig.DEFAULTS[name]
+    if isinstance(default, bool):
+        if value.lower() not in ('true', 'false', '1', '0', 'yes', 'no', 'on', 'off'):
+            raise ValueError(f"Expected a boolean for {name}, got {value!r}")
+        return name, value.lower() in ('true', '1', 'yes', 'on')
+    return name, type(default)(value)
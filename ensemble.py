@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import numpy as np
+from ant import Ant
+from config import SimulationConfig
+from headless import build_simulation, run_headless
+from scenario import load_scenario
+
+
+class ForagingMetrics:
+    # Tick observer that follows foraging as it happens: when each food source runs out and how
+    # long each ant's trips take, from leaving the nest until it is back with food. Ants of every
+    # colony count, rival nests included.
+    def __init__(self, sim):
+        self.depleted_at = {}
+        self.food_positions = {}
+        self.foods_alive = {}
+        self.trip_start = []  # per colony, the tick each ant's current trip started
+        self.previous_states = []  # per colony, the ants' states at the previous tick
+        self.trip_lengths = []
+        self.watch_foods(sim)
+        sim.add_tick_observer(self.on_tick)
+
+    def watch_foods(self, sim):
+        for food in sim.foods:
+            if id(food) not in self.food_positions:
+                self.food_positions[id(food)] = [float(value) for value in food.position]
+                self.foods_alive[id(food)] = food
+
+    def on_tick(self, sim):
+        tick = sim.tick
+        self.watch_foods(sim)
+        for key, food in list(self.foods_alive.items()):
+            if food.is_empty():
+                self.depleted_at[key] = tick
+                del self.foods_alive[key]
+
+        # A trip ends when a returning ant turns back into an explorer, i.e. drops food at the nest.
+        # Ants only ever get appended to a swarm, so index i is the same ant from tick to tick.
+        while len(self.trip_start) < len(sim.colonies):
+            self.trip_start.append(np.zeros(0, dtype=np.int64))
+            self.previous_states.append(np.zeros(0, dtype=np.int8))
+        for index, colony in enumerate(sim.colonies):
+            swarm = colony.swarm
+            states = swarm.states[:swarm.count]
+            trip_start, previous_states = self.trip_start[index], self.previous_states[index]
+            known = len(previous_states)
+            if swarm.count > known:
+                trip_start = np.concatenate((trip_start, np.full(swarm.count - known, tick)))
+            delivered = np.flatnonzero((previous_states == Ant.RETURNING) & (states[:known] == Ant.EXPLORING))
+            self.trip_lengths.extend((tick - trip_start[delivered]).tolist())
+            trip_start[delivered] = tick
+            self.trip_start[index], self.previous_states[index] = trip_start, states.copy()
+
+    def results(self, sim, ticks):
+        delivered = sum(colony.swarm.food_delivered for colony in sim.colonies)
+        depletion_ticks = [self.depleted_at.get(key) for key in self.food_positions]
+        return {
+            'ticks': ticks,
+            'ants': sum(len(colony.swarm) for colony in sim.colonies),
+            'food_delivered': delivered,
+            'food_delivered_per_colony': [colony.swarm.food_delivered for colony in sim.colonies],
+            'food_per_tick': delivered / ticks if ticks else 0.0,
+            'food_sources': [{'position': position, 'depleted_at': self.depleted_at.get(key)}
+                             for key, position in self.food_positions.items()],
+            'all_depleted_at': max(depletion_ticks) if depletion_ticks and None not in depletion_ticks else None,
+            'trips': len(self.trip_lengths),
+            'mean_trip_length': float(np.mean(self.trip_lengths)) if self.trip_lengths else None,
+        }
+
+
+def expand_spec(spec):
+    # All runs of a sweep spec as (params, seed) pairs. Random search draws from its own seeded
+    # generator, so expanding the same spec again gives the same runs (needed to resume).
+    base = spec.get('base', {})
+    seeds = spec.get('seeds', [0])
+    if isinstance(seeds, int):
+        seeds = list(range(seeds))
+
+    if 'grid' in spec:
+        names = list(spec['grid'])
+        param_sets = [dict(base, **dict(zip(names, values)))
+                      for values in itertools.product(*(spec['grid'][name] for name in names))]
+    elif 'random' in spec:
+        rng = np.random.default_rng(spec.get('search_seed', 0))
+        param_sets = []
+        for _ in range(spec.get('samples', 10)):
+            params = dict(base)
+            for name, bounds in spec['random'].items():
+                if isinstance(bounds, dict):
+                    params[name] = bounds['choices'][int(rng.integers(len(bounds['choices'])))]
+                elif isinstance(SimulationConfig.DEFAULTS.get(name), int):
+                    params[name] = int(rng.integers(bounds[0], bounds[1] + 1))
+                else:
+                    params[name] = float(rng.uniform(bounds[0], bounds[1]))
+            param_sets.append(params)
+    else:
+        param_sets = [dict(base)]
+
+    for params in param_sets:
+        SimulationConfig(**params)  # fail early on unknown settings, not in a worker
+    return [(params, seed) for params in param_sets for seed in seeds]
+
+
+def run_id(params, seed, ticks, world):
+    key = json.dumps({'params': params, 'seed': seed, 'ticks': ticks, 'world': world}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def run_task(task):
+    # One headless run; executed in a pool worker
+    world = task['world']
+    scenario = load_scenario(world['scenario']) if 'scenario' in world else None
+    settings = dict(scenario.config or {}) if scenario is not None else {}
+    settings.update(task['params'])
+    sim = build_simulation(world.get('foods', ()), world.get('obstacles', ()), world.get('random_food', 0),
+                           task['seed'], [tuple(nest) for nest in world.get('nests', ())],
+                           config=SimulationConfig(**settings), scenario=scenario)
+    metrics = ForagingMetrics(sim)
+    summary = run_headless(sim, task['ticks'], stop_when_food_gone=task['stop_when_food_gone'])
+    results = metrics.results(sim, summary['ticks'])
+    results['elapsed_seconds'] = summary['elapsed_seconds']
+    return {'run_id': task['run_id'], 'params': task['params'], 'seed': task['seed'], 'metrics': results}
+
+
+def completed_runs(path):
+    # Run ids already in a results file; a partly written last line (from a crash) is ignored
+    done = set()
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                try:
+                    done.add(json.loads(line)['run_id'])
+                except (ValueError, KeyError):
+                    continue
+    return done
+
+
+def run_ensemble(spec, output, workers=None, log=print):
+    # Run every pending run of the spec on a process pool, appending each result to `output`
+    # (JSON lines) as soon as it finishes. Runs already in `output` are skipped.
+    ticks = spec.get('ticks', 5000)
+    world = spec.get('world', {})
+    stop_when_food_gone = spec.get('stop_when_food_gone', True)
+    tasks = [{'run_id': run_id(params, seed, ticks, world), 'params': params, 'seed': seed, 'ticks': ticks,
+              'world': world, 'stop_when_food_gone': stop_when_food_gone}
+             for params, seed in expand_spec(spec)]
+    done = completed_runs(output)
+    pending = [task for task in tasks if task['run_id'] not in done]
+    log(f"{len(tasks)} runs, {len(tasks) - len(pending)} already done, {len(pending)} to go")
+    if not pending:
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers or os.cpu_count()) as pool, open(output, 'a') as file:
+        for finished, result in enumerate(pool.imap_unordered(run_task, pending), 1):
+            file.write(json.dumps(result) + '\n')
+            file.flush()
+            metrics = result['metrics']
+            log(f"[{finished}/{len(pending)}] seed={result['seed']} {result['params']} "
+                f"food/tick={metrics['food_per_tick']:.4f} mean trip={metrics['mean_trip_length']}")
+
+
+def summarize_results(path, top=10):
+    # Mean of the main metrics over seeds for every parameter set, best food per tick first
+    groups = {}
+    with open(path) as file:
+        for line in file:
+            result = json.loads(line)
+            groups.setdefault(json.dumps(result['params'], sort_keys=True), []).append(result['metrics'])
+
+    rows = []
+    for params, runs in groups.items():
+        trips = [run['mean_trip_length'] for run in runs if run['mean_trip_length'] is not None]
+        depleted = [run['all_depleted_at'] for run in runs if run['all_depleted_at'] is not None]
+        rows.append({
+            'params': json.loads(params),
+            'runs': len(runs),
+            'food_per_tick': float(np.mean([run['food_per_tick'] for run in runs])),
+            'mean_trip_length': float(np.mean(trips)) if trips else None,
+            'all_depleted_at': float(np.mean(depleted)) if depleted else None,
+            'runs_depleted': len(depleted),
+        })
+    rows.sort(key=lambda row: row['food_per_tick'], reverse=True)
+    return rows[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of headless simulations on a process pool.")
+    parser.add_argument('spec', help="JSON sweep spec (see README)")
+    parser.add_argument('--output', default='ensemble_results.jsonl',
+                        help="results file (JSON lines); an existing file is resumed")
+    parser.add_argument('--workers', type=int, default=None, help="pool size (default: one per CPU)")
+    parser.add_argument('--top', type=int, default=10, help="parameter sets to show in the summary")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as file:
+        spec = json.load(file)
+    run_ensemble(spec, args.output, args.workers)
+    for row in summarize_results(args.output, args.top):
+        print(json.dumps(row))
+
+if __name__ == "__main__":
+    main()
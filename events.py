@@ -0,0 +1,187 @@
+import time
+import numpy as np
+
+
+class EventType:
+    # Kinds of simulation events; NAMES[kind] is used in counters and sink output
+    ANT_SPAWNED = 0
+    FOOD_TAKEN = 1
+    FOOD_DELIVERED = 2
+    FOOD_DEPLETED = 3
+    FOOD_PLACED = 4
+    OBSTACLE_PLACED = 5
+    NAMES = ('ant_spawned', 'food_taken', 'food_delivered', 'food_depleted', 'food_placed', 'obstacle_placed')
+
+
+# One row per event; `count` is how many things the event stands for (e.g. ants in a spawn batch)
+EVENT_DTYPE = np.dtype([('tick', np.int64), ('kind', np.int8), ('colony', np.int16),
+                        ('x', np.float32), ('y', np.float32), ('count', np.int32)])
+# Events shown by the console sink by default; per-ant events would flood it
+CONSOLE_EVENTS = (EventType.ANT_SPAWNED, EventType.FOOD_DEPLETED, EventType.FOOD_PLACED, EventType.OBSTACLE_PLACED)
+
+
+class EventLog:
+    # Typed simulation events in a preallocated ring buffer, plus running totals per event type.
+    # Recording only writes into the buffer; sinks (callables taking an EVENT_DTYPE array) get the
+    # new events in bulk from flush(), which the simulation calls every `flush_every` ticks and which
+    # also runs early if the buffer would otherwise overwrite events the sinks have not seen.
+    # Without sinks the buffer just keeps the latest `capacity` events for last().
+    def __init__(self, capacity=65536, flush_every=60):
+        self.buffer = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.counters = np.zeros(len(EventType.NAMES), dtype=np.int64)
+        self.sinks = []
+        self.tick = 0
+        self.recorded = 0  # events ever written; the next one goes to recorded % capacity
+        self.flushed = 0  # events handed to the sinks so far
+        self.dropped = 0  # events too many for one batch, never seen by the sinks
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def record(self, kind, x=0.0, y=0.0, colony=0, count=1):
+        # A single event, e.g. a click or a spawn batch
+        self.reserve(1)
+        self.buffer[self.recorded % self.capacity] = (self.tick, kind, colony, x, y, count)
+        self.recorded += 1
+        self.counters[kind] += count
+
+    def record_many(self, kind, positions, colony=0, count=1):
+        # One event per row of an (n, 2) positions array, e.g. every ant that delivered food this tick
+        n = len(positions)
+        if n == 0:
+            return
+        self.counters[kind] += n * count
+        if n > self.capacity:
+            self.dropped += n - self.capacity
+            positions = positions[-self.capacity:]
+            n = self.capacity
+        self.reserve(n)
+        start = self.recorded % self.capacity
+        first = min(n, self.capacity - start)
+        for rows, part in ((self.buffer[start:start + first], positions[:first]),
+                           (self.buffer[:n - first], positions[first:])):
+            rows['tick'], rows['kind'], rows['colony'] = self.tick, kind, colony
+            rows['x'], rows['y'], rows['count'] = part[:, 0], part[:, 1], count
+        self.recorded += n
+
+    def reserve(self, n):
+        # Make room for n more events without overwriting any the sinks still need
+        if self.sinks and self.recorded + n - self.flushed > self.capacity:
+            self.flush()
+
+    def end_tick(self, tick):
+        # Called by the simulation after every tick; events are stamped with self.tick, which it sets
+        if self.sinks and tick % self.flush_every == 0:
+            self.flush()
+
+    def pending(self):
+        # Events recorded since the last flush, oldest first
+        return self.last(self.recorded - self.flushed)
+
+    def last(self, n):
+        # Copy of the latest n events still in the buffer, oldest first
+        n = min(n, self.recorded, self.capacity)
+        start = (self.recorded - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.buffer[start:start + n].copy()
+        return np.concatenate((self.buffer[start:], self.buffer[:start + n - self.capacity]))
+
+    def flush(self):
+        # Hand everything recorded since the last flush to every sink
+        events = self.pending()
+        self.flushed = self.recorded
+        if len(events) == 0:
+            return
+        for sink in self.sinks:
+            sink(events)
+
+    def message(self, text):
+        # Free-form text such as a profiling report, handed right away to the sinks that show
+        # messages (those with a `message` method); it is not an event and is not counted
+        for sink in self.sinks:
+            if hasattr(sink, 'message'):
+                sink.message(text)
+
+    def close(self):
+        self.flush()
+        for sink in self.sinks:
+            if hasattr(sink, 'close'):
+                sink.close()
+
+    def totals(self):
+        return {name: int(total) for name, total in zip(EventType.NAMES, self.counters)}
+
+
+def describe(event):
+    # One line of text for an event (a row of an EVENT_DTYPE array)
+    kind, colony, count = int(event['kind']), int(event['colony']), int(event['count'])
+    where = f"({float(event['x']):g}, {float(event['y']):g})"
+    if kind == EventType.ANT_SPAWNED:
+        return f"Spawned {count} ants at nest {colony}"
+    if kind == EventType.FOOD_TAKEN:
+        return f"Ant of colony {colony} took food at {where}"
+    if kind == EventType.FOOD_DELIVERED:
+        return f"Ant of colony {colony} delivered food at {where}"
+    if kind == EventType.FOOD_DEPLETED:
+        return f"Food at {where} is depleted"
+    if kind == EventType.FOOD_PLACED:
+        return f"Food placed at {where}"
+    return f"Obstacle placed at {where}"
+
+
+class EventFile:
+    # Sink appending events to a CSV file, one write per flush
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.file.write('tick,event,colony,x,y,count\n')
+
+    def __call__(self, events):
+        names = EventType.NAMES
+        self.file.write(''.join(f"{tick},{names[kind]},{colony},{x:g},{y:g},{count}\n"
+                                for tick, kind, colony, x, y, count in events.tolist()))
+
+    def close(self):
+        self.file.close()
+
+
+class ConsoleSink:
+    # Sink printing events of the given kinds, at most `per_second` lines a second on average
+    # (in bursts of up to `per_second` lines). Events over the limit are counted and reported
+    # in one line once there is room again. Messages are printed as they come.
+    def __init__(self, kinds=CONSOLE_EVENTS, per_second=5, output=print):
+        self.kinds = np.array(kinds)
+        self.per_second = per_second
+        self.output = output
+        self.allowance = float(per_second)
+        self.last_time = time.monotonic()
+        self.suppressed = 0
+
+    def __call__(self, events):
+        events = events[np.isin(events['kind'], self.kinds)]
+        if len(events) == 0 and not self.suppressed:
+            return
+        now = time.monotonic()
+        self.allowance = min(self.per_second, self.allowance + (now - self.last_time) * self.per_second)
+        self.last_time = now
+        if self.suppressed and self.allowance >= 1:
+            self.output(f"... {self.suppressed} more events not shown")
+            self.allowance -= 1
+            self.suppressed = 0
+        shown = min(len(events), int(self.allowance))
+        self.allowance -= shown
+        self.suppressed += len(events) - shown
+        for event in events[:shown]:
+            self.output(describe(event))
+
+    def message(self, text):
+        self.output(text)
+
+    def close(self):
+        if self.suppressed:
+            self.output(f"... {self.suppressed} more events not shown")
+            self.suppressed = 0
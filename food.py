@@ -8,11 +8,11 @@ class Food:
         self.amount = size * size * 5
         self.initial_amount = self.amount
 
-    def take_food(self):
-        if self.amount > 0:
-            self.amount -= 1
-            return True
-        return False
+    def take_food(self, count=1):
+        # Take up to `count` units and return how many were actually taken
+        taken = min(count, max(self.amount, 0))
+        self.amount -= taken
+        return taken
 
     def is_empty(self):
         return self.amount <= 0
@@ -22,3 +22,97 @@ class Food:
         current_size = max(1, int(self.size * cell_size * remaining_ratio ** 0.5))
         pos = (int(self.position[0] * cell_size), int(self.position[1] * cell_size))
         pygame.draw.rect(screen, (0, 255, 0), (pos[0], pos[1], current_size, current_size))
+
+
+class FoodIndex:
+    # Food piles bucketed into square cells so that range queries for the whole swarm are one batched lookup
+    def __init__(self, width, height, bucket_size=3):
+        self.width = width
+        self.height = height
+        self.bucket_size = bucket_size
+        self.foods = []
+        self.positions = np.zeros((0, 2))
+        self.buckets = np.full((1, 1, 1), -1, dtype=np.int32)
+        self.version = 0  # bumped on every rebuild, i.e. whenever piles are added or removed
+
+    def __iter__(self):
+        return iter(self.foods)
+
+    def __len__(self):
+        return len(self.foods)
+
+    def __getitem__(self, index):
+        return self.foods[index]
+
+    def add(self, food):
+        self.foods.append(food)
+        self.rebuild()
+
+    def extend(self, foods):
+        # Add many piles with a single rebuild
+        self.foods.extend(foods)
+        self.rebuild()
+
+    def remove_depleted(self):
+        # Drop empty piles from the index and return them
+        depleted = [food for food in self.foods if food.is_empty()]
+        if depleted:
+            self.foods = [food for food in self.foods if not food.is_empty()]
+            self.rebuild()
+        return depleted
+
+    def rebuild(self):
+        # Rebuild the (bucket_y, bucket_x, slot) table of food ids, padded with -1
+        self.version += 1
+        self.positions = np.array([food.position for food in self.foods]).reshape(-1, 2)
+        bucket_x, bucket_y = self.bucket_coords(self.positions)
+        rows = self.height // self.bucket_size + 1
+        cols = self.width // self.bucket_size + 1
+        flat = bucket_y * cols + bucket_x
+        slots = np.bincount(flat, minlength=rows * cols).max(initial=1)
+        self.buckets = np.full((rows, cols, slots), -1, dtype=np.int32)
+        order = np.argsort(flat, kind='stable')
+        flat = flat[order]
+        rank = np.arange(len(flat)) - np.searchsorted(flat, flat)
+        self.buckets[bucket_y[order], bucket_x[order], rank] = order
+
+    def bucket_coords(self, positions):
+        rows = self.height // self.bucket_size + 1
+        cols = self.width // self.bucket_size + 1
+        bucket_x = np.clip((positions[:, 0] // self.bucket_size).astype(int), 0, cols - 1)
+        bucket_y = np.clip((positions[:, 1] // self.bucket_size).astype(int), 0, rows - 1)
+        return bucket_x, bucket_y
+
+    def nearest(self, positions, radius):
+        # Index of the closest food strictly within `radius` of each position, or -1
+        nearest = np.full(len(positions), -1)
+        if not self.foods or len(positions) == 0:
+            return nearest
+        rows, cols, _ = self.buckets.shape
+        reach = int(np.ceil(radius / self.bucket_size))
+        bucket_x, bucket_y = self.bucket_coords(positions)
+        offsets = np.arange(-reach, reach + 1)
+        near_y = np.clip(bucket_y[:, None, None] + offsets[None, :, None], 0, rows - 1)
+        near_x = np.clip(bucket_x[:, None, None] + offsets[None, None, :], 0, cols - 1)
+        candidates = self.buckets[near_y, near_x].reshape(len(positions), -1)
+
+        # Clipped edge buckets can repeat a candidate, which does not change the minimum
+        deltas = self.positions[candidates] - positions[:, None, :]
+        distances = np.hypot(deltas[..., 0], deltas[..., 1])
+        distances[(candidates < 0) | (distances >= radius)] = np.inf
+        closest = np.argmin(distances, axis=1)
+        found = np.isfinite(distances[np.arange(len(positions)), closest])
+        nearest[found] = candidates[found, closest[found]]
+        return nearest
+
+    def take(self, food_indices):
+        # Claims are served in order; returns which claims got a unit of food
+        granted = np.zeros(len(food_indices), dtype=bool)
+        if len(food_indices) == 0:
+            return granted
+        order = np.argsort(food_indices, kind='stable')
+        piles, first, claims = np.unique(food_indices[order], return_index=True, return_counts=True)
+        for pile, start, count in zip(piles, first, claims):
+            taken = self.foods[pile].take_food(int(count))
+            granted[order[start:start + taken]] = True
+        return granted
@@ -1,76 +1,154 @@
 import numpy as np
-
-class GridCell:
-    def __init__(self):
-        self.pheromones = {}
-        self.ants = []
-
+from pheromone_map import COLONY_COLORS, PheromoneMap, PheromoneRenderer, diffusion_self_weight, evaporate_diffuse_stack
 
 class Grid:
-    def __init__(self, width, height, cell_size):
+    # Multi-colony pheromone store: one dense (pheromone type, colony, y, x) tensor.
+    # Pheromone types and colony ids are mapped to tensor indices through small registries.
+    # Evaporation and diffusion follow the same rules as PheromoneMap, including its boundary modes,
+    # so rival colonies' trails behave like the first colony's.
+    def __init__(self, width, height, cell_size, pheromone_types=("food",), dtype=np.float64, boundary='reflect',
+                 obstacles=None):
+        if boundary not in PheromoneMap.BOUNDARY_MODES:
+            raise ValueError(f"Unknown boundary mode {boundary!r}, expected one of {PheromoneMap.BOUNDARY_MODES}")
         self.width = width // cell_size
         self.height = height // cell_size
+        if boundary == 'obstacle' and (obstacles is None or obstacles.solid.shape != (self.height, self.width)):
+            raise ValueError("The 'obstacle' boundary mode needs an ObstacleMap with one cell per grid cell")
         self.cell_size = cell_size
-        self.cells = np.array([[GridCell() for _ in range(self.height)] for _ in range(self.width)])
+        self.dtype = np.dtype(dtype)
+        self.boundary = boundary
+        self.obstacles = obstacles
+        self.decay_rate = 0.995
+        self.diffusion_rate = 0.1
+        self.pheromone_types = {}
+        self.colonies = {}
+        self.pheromones = np.zeros((0, 0, self.height, self.width), dtype=self.dtype)
+        for pheromone_type in pheromone_types:
+            self.register_pheromone_type(pheromone_type)
+        self.self_weight = np.zeros((self.height, self.width), dtype=self.dtype)
+        self.weight_key = None
+        self.scaled = None
+        self.buffer = None
+
+    def register_pheromone_type(self, pheromone_type):
+        # Tensor index of a pheromone type, adding a new slice the first time it is seen
+        if pheromone_type not in self.pheromone_types:
+            self.pheromone_types[pheromone_type] = len(self.pheromone_types)
+            self.resize()
+        return self.pheromone_types[pheromone_type]
+
+    def register_colony(self, colony_id):
+        # Tensor index of a colony, adding a new slice the first time it is seen
+        if colony_id not in self.colonies:
+            self.colonies[colony_id] = len(self.colonies)
+            self.resize()
+        return self.colonies[colony_id]
+
+    def resize(self):
+        shape = (len(self.pheromone_types), len(self.colonies), self.height, self.width)
+        pheromones = np.zeros(shape, dtype=self.dtype)
+        old_types, old_colonies = self.pheromones.shape[:2]
+        pheromones[:old_types, :old_colonies] = self.pheromones
+        self.pheromones = pheromones
+        self.scaled = None
+        self.buffer = None
+
+    def colony_view(self, colony_id):
+        return ColonyPheromones(self, colony_id)
 
     def get_cell_coords(self, pos):
         x_cell = int(pos[0] // self.cell_size)
         y_cell = int(pos[1] // self.cell_size)
         return (x_cell, y_cell)
 
-    def get_cell(self, pos):
-        coords = self.get_cell_coords(pos)
-        if 0 <= coords[0] < self.width and 0 <= coords[1] < self.height:
-            return self.cells[coords[0]][coords[1]]
-        return None
-
-    def add_ant(self, ant):
-        cell = self.get_cell(ant.position)
-        if cell:
-            cell.ants.append(ant)
-
-    def remove_ant(self, ant):
-        cell = self.get_cell(ant.position)
-        if cell and ant in cell.ants:
-            cell.ants.remove(ant)
+    def cell_indices(self, positions):
+        # Batched get_cell_coords, plus a mask of the positions that fall inside the grid
+        x = (positions[:, 0] // self.cell_size).astype(int)
+        y = (positions[:, 1] // self.cell_size).astype(int)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        return x, y, inside
 
     def add_pheromone(self, pos, colony_id, intensity, pheromone_type="food"):
-        cell = self.get_cell(pos)
-        if cell:
-            if pheromone_type not in cell.pheromones:
-                cell.pheromones[pheromone_type] = {}
-            if colony_id not in cell.pheromones[pheromone_type]:
-                cell.pheromones[pheromone_type][colony_id] = 0
-            cell.pheromones[pheromone_type][colony_id] += intensity
+        self.add_pheromones(np.array([pos], dtype=float), colony_id, intensity, pheromone_type)
+
+    def add_pheromones(self, positions, colony_id, intensity, pheromone_type="food"):
+        # Batched deposit; repeated cells accumulate
+        type_index = self.register_pheromone_type(pheromone_type)
+        colony_index = self.register_colony(colony_id)
+        x, y, inside = self.cell_indices(positions)
+        np.add.at(self.pheromones[type_index, colony_index], (y[inside], x[inside]), intensity)
 
     def get_pheromones(self, pos, pheromone_type="food"):
-        cell = self.get_cell(pos)
-        if cell and pheromone_type in cell.pheromones:
-            return cell.pheromones[pheromone_type]
-        return {}
-
-    def decay_pheromones(self):
-        for x in range(self.width):
-            for y in range(self.height):
-                cell = self.cells[x][y]
-                for pheromone_type in cell.pheromones:
-                    for colony_id in cell.pheromones[pheromone_type]:
-                        cell.pheromones[pheromone_type][colony_id] *= 0.995  # Decay rate
-
-    def diffuse_pheromones(self):
-        new_pheromones = np.array([[GridCell() for _ in range(self.height)] for _ in range(self.width)])
-
-        for x in range(self.width):
-            for y in range(self.height):
-                cell = self.cells[x][y]
-                for pheromone_type in cell.pheromones:
-                    for colony_id, intensity in cell.pheromones[pheromone_type].items():
-                        neighbors = [
-                            (x + dx, y + dy)
-                            for dx in [-1, 0, 1]
-                            for dy in [-1, 0, 1]
-                            if 0 <= x + dx < self.width and 0 <= y + dy < self.height
-                        ]
-                        for nx, ny in neighbors:
-                            if pheromone_type not in new_pheromones[nx][ny].pheromones:
-                                new_pheromones[nx][ny].pheromones[pheromone_type] = {}
+        # Intensity of every colony's pheromone at a position, as {colony_id: intensity}
+        x, y = self.get_cell_coords(pos)
+        if pheromone_type not in self.pheromone_types or not (0 <= x < self.width and 0 <= y < self.height):
+            return {}
+        values = self.pheromones[self.pheromone_types[pheromone_type], :, y, x]
+        return {colony_id: float(values[index]) for colony_id, index in self.colonies.items()}
+
+    def sense(self, positions, colony_id, pheromone_type="food"):
+        # Batched lookup of one colony's pheromone; positions outside the grid read 0
+        strengths = np.zeros(len(positions))
+        if pheromone_type not in self.pheromone_types or colony_id not in self.colonies:
+            return strengths
+        field = self.pheromones[self.pheromone_types[pheromone_type], self.colonies[colony_id]]
+        x, y, inside = self.cell_indices(positions)
+        strengths[inside] = field[y[inside], x[inside]]
+        return strengths
+
+    def update(self):
+        # One evaporate+diffuse step for every pheromone type and colony at once, into the back buffer
+        if self.buffer is None:
+            self.buffer = np.zeros_like(self.pheromones)
+            self.scaled = np.zeros_like(self.pheromones)
+        self.update_weights()
+        solid = self.obstacles.solid if self.boundary == 'obstacle' else None
+        evaporate_diffuse_stack(self.pheromones, self.buffer, self.scaled, self.self_weight,
+                                self.decay_rate * self.diffusion_rate / 8, self.boundary, solid)
+        self.pheromones, self.buffer = self.buffer, self.pheromones
+
+    def update_weights(self):
+        # Same self weights as PheromoneMap.update_weights, recomputed when the rates or obstacles change
+        version = self.obstacles.version if self.boundary == 'obstacle' else None
+        key = (self.decay_rate, self.diffusion_rate, self.boundary, version)
+        if key == self.weight_key:
+            return
+        self.weight_key = key
+        solid = self.obstacles.solid if self.boundary == 'obstacle' else None
+        diffusion_self_weight(self.decay_rate, self.diffusion_rate, self.boundary, solid, self.self_weight)
+
+
+class ColonyPheromones:
+    # One colony's slice of a Grid, with the same batched interface that Swarm uses on a PheromoneMap
+    def __init__(self, grid, colony_id):
+        self.grid = grid
+        self.colony_id = colony_id
+        self.renderer = None
+        grid.register_colony(colony_id)
+
+    def deposit_pheromones(self, positions, pheromone_type, amount=1.0):
+        self.grid.add_pheromones(positions, self.colony_id, amount, pheromone_type)
+
+    def get_pheromone_strengths(self, positions, pheromone_type):
+        return self.grid.sense(positions, self.colony_id, pheromone_type)
+
+    # Views of the colony's fields by pheromone type, like PheromoneMap.pheromones; taken on every access
+    # because the grid swaps its buffers each update
+    @property
+    def pheromones(self):
+        colony_index = self.grid.colonies[self.colony_id]
+        return {ptype: self.grid.pheromones[index, colony_index] for ptype, index in self.grid.pheromone_types.items()}
+
+    @property
+    def width(self):
+        return self.grid.width
+
+    @property
+    def height(self):
+        return self.grid.height
+
+    def draw(self, screen, cell_size):
+        # Drawn in the colony's own colours over the first colony's trails
+        if self.renderer is None or self.renderer.cell_size != cell_size:
+            self.renderer = PheromoneRenderer(self, cell_size, colors=COLONY_COLORS[self.colony_id % len(COLONY_COLORS)])
+        self.renderer.draw(screen)
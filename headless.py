@@ -0,0 +1,156 @@
+import argparse
+import json
+import time
+import checkpoint
+from recorder import FrameRecorder
+import numpy as np
+from config import SimulationConfig, parse_setting
+from events import ConsoleSink, EventFile
+from food import Food
+from obstacle import Obstacle
+from scenario import apply_scenario, load_scenario, save_scenario
+from simulation import Simulation
+from tiled_pheromone_map import TiledPheromoneMap
+
+# Build the same world as the interactive simulation, without a display
+def build_simulation(foods=(), obstacles=(), random_foods=0, seed=None, nests=(), tiled_pheromones=False, config=None,
+                     scenario=None):
+    # A scenario (see scenario.py) gives the grid size and the starting world; the rest is added on top
+    if scenario is not None:
+        sim = Simulation(headless=True, seed=seed, tiled_pheromones=tiled_pheromones,
+                         config=scenario.simulation_config(config), grid_size=scenario.grid_size)
+        apply_scenario(sim, scenario, settings=False)
+    else:
+        sim = Simulation(headless=True, seed=seed, tiled_pheromones=tiled_pheromones, config=config)
+    for x, y in foods:
+        sim.foods.add(Food(x, y, 3))
+    for x, y in obstacles:
+        sim.obstacles.add(Obstacle(x, y, 3))
+    for nest in nests:
+        sim.add_colony(nest)
+
+    # Random food piles are placed with their own generator so the layout only depends on the seed
+    layout_rng = np.random.default_rng(seed)
+    for _ in range(random_foods):
+        x, y = layout_rng.integers(0, sim.grid_width - 3), layout_rng.integers(0, sim.grid_height - 3)
+        sim.foods.add(Food(int(x), int(y), 3))
+    return sim
+
+# Step the simulation as fast as possible for max_ticks, or until all the food is gone
+def run_headless(sim, max_ticks, stop_when_food_gone=True, observer_every=0):
+    had_food = bool(sim.foods)
+    start = time.perf_counter()
+    ticks = 0
+    while ticks < max_ticks:
+        sim.update()
+        ticks += 1
+        if observer_every and ticks % observer_every == 0:
+            if sim.parallel is not None:
+                sim.parallel.gather()
+            sim.notify_observers()
+        if stop_when_food_gone and had_food and not sim.foods:
+            break
+    elapsed = time.perf_counter() - start
+    if sim.parallel is not None:
+        sim.parallel.gather()
+    return summarize(sim, ticks, elapsed)
+
+# Summary metrics of a finished run
+def summarize(sim, ticks, elapsed):
+    metrics = {
+        'ticks': ticks,
+        'elapsed_seconds': elapsed,
+        'ticks_per_second': ticks / elapsed if elapsed > 0 else float('inf'),
+        'ants': sum(len(colony.swarm) for colony in sim.colonies),
+        'food_delivered': sum(colony.swarm.food_delivered for colony in sim.colonies),
+        'food_delivered_per_colony': [colony.swarm.food_delivered for colony in sim.colonies],
+        'food_sources_remaining': len(sim.foods),
+        'food_remaining': sum(food.amount for food in sim.foods),
+        'total_pheromone': {int(ptype): float(field.sum()) for ptype, field in sim.pheromone_map.pheromones.items()},
+        'phases_ms': sim.profiler.stats(),
+        'events': sim.events.totals(),
+    }
+    if isinstance(sim.pheromone_map, TiledPheromoneMap):
+        metrics['pheromone_tiles'] = sim.pheromone_map.stats()
+    return metrics
+
+def parse_point(text):
+    x, y = text.split(',')
+    return int(x), int(y)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ant simulation without a display.")
+    parser.add_argument('--ticks', type=int, default=10000, help="maximum number of ticks to run")
+    parser.add_argument('--food', type=parse_point, action='append', default=[], metavar='X,Y',
+                        help="place a food pile at grid cell X,Y (repeatable)")
+    parser.add_argument('--obstacle', type=parse_point, action='append', default=[], metavar='X,Y',
+                        help="place an obstacle at grid cell X,Y (repeatable)")
+    parser.add_argument('--nest', type=parse_point, action='append', default=[], metavar='X,Y',
+                        help="add a rival colony with its nest at grid cell X,Y (repeatable)")
+    parser.add_argument('--random-food', type=int, default=0, help="number of randomly placed food piles")
+    parser.add_argument('--seed', type=int, default=None, help="random seed")
+    parser.add_argument('--set', type=parse_setting, action='append', default=[], metavar='NAME=VALUE',
+                        help="change a simulation setting, e.g. --set max_ants=200 (repeatable)")
+    parser.add_argument('--tiled', action='store_true', help="use the sparse tiled pheromone store")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="run the colony on this many worker processes (0 = single process)")
+    parser.add_argument('--scenario', metavar='PATH', help="build the world from a scenario file (.png, .npz or .json)")
+    parser.add_argument('--export-scenario', metavar='PATH', help="write the world to a scenario file when the run ends")
+    parser.add_argument('--restore', metavar='PATH', help="start from a checkpoint instead of building a new world")
+    parser.add_argument('--save', metavar='PATH', help="write a checkpoint when the run ends")
+    parser.add_argument('--record', metavar='PATH', help="record frames to a memory-mapped log for replay")
+    parser.add_argument('--record-every', type=int, default=1, help="record every k-th tick")
+    parser.add_argument('--record-max-ants', type=int, default=0,
+                        help="ants stored per frame (default: max_ants for every colony); more are dropped with a warning")
+    parser.add_argument('--record-pheromones', choices=['uint8', 'float16'], default=None,
+                        help="also record the pheromone fields, quantized to this type")
+    parser.add_argument('--profile-output', metavar='PATH',
+                        help="write per-phase timings to PATH (.csv or .json) when the run ends")
+    parser.add_argument('--keep-going', action='store_true', help="do not stop when all food is gone")
+    parser.add_argument('--events', metavar='PATH', help="write every event (spawns, food pickups, ...) to PATH as CSV")
+    parser.add_argument('--log-events', action='store_true', help="print spawns, depleted food etc. (rate-limited)")
+    args = parser.parse_args(argv)
+
+    if args.restore:
+        sim = checkpoint.load_checkpoint(args.restore)
+    else:
+        # --set changes the scenario's own settings, if it has any
+        scenario = load_scenario(args.scenario) if args.scenario else None
+        settings = dict(scenario.config or {}) if scenario is not None else {}
+        settings.update(args.set)
+        sim = build_simulation(args.food, args.obstacle, args.random_food, args.seed, args.nest, args.tiled,
+                               SimulationConfig(**settings), scenario)
+    if args.events:
+        sim.events.add_sink(EventFile(args.events))
+    if args.log_events:
+        sim.events.add_sink(ConsoleSink())
+    recorder = None
+    if args.record:
+        # Frames hold every ant the colonies can grow to, unless --record-max-ants says otherwise
+        max_ants = args.record_max_ants or max(sim.config.max_ants * len(sim.colonies),
+                                                sum(len(colony.swarm) for colony in sim.colonies))
+        recorder = FrameRecorder(args.record, args.ticks // args.record_every + 1, args.record_every,
+                                 max_ants=max_ants, max_foods=max(len(sim.foods), 1),
+                                 max_colonies=len(sim.colonies), pheromones=args.record_pheromones,
+                                 width=sim.grid_width, height=sim.grid_height)
+        recorder.attach(sim)
+    if args.workers:
+        sim.start_parallel(args.workers)
+    try:
+        metrics = run_headless(sim, args.ticks, stop_when_food_gone=not args.keep_going)
+    finally:
+        sim.stop_parallel()
+        sim.events.close()
+        if recorder is not None:
+            recorder.close()
+        if args.profile_output:
+            sim.profiler.dump(args.profile_output)
+    if args.save:
+        checkpoint.save_checkpoint(sim, args.save, background=False)
+    if args.export_scenario:
+        save_scenario(sim, args.export_scenario)
+    print(json.dumps(metrics, indent=2))
+    return metrics
+
+if __name__ == "__main__":
+    main()
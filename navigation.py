@@ -0,0 +1,268 @@
+import heapq
+import math
+import threading
+import numpy as np
+from backend import numba_available
+
+# Neighbours used for the fall-back step direction (dx, dy, cost); diagonal steps may not cut
+# the corner of a solid cell
+MOVES = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+         (1, 1, 2 ** 0.5), (1, -1, 2 ** 0.5), (-1, 1, 2 ** 0.5), (-1, -1, 2 ** 0.5))
+# Rows of headings worked out at once after a full compute, which bounds the temporary arrays
+HEADING_ROWS = 256
+_kernels = None
+
+
+def compiled_kernels():
+    # numba_kernels when numba is installed, else None and the march runs as plain Python
+    global _kernels
+    if _kernels is None:
+        _kernels = False
+        if numba_available():
+            import numba_kernels
+            _kernels = numba_kernels
+    return _kernels or None
+
+
+def march_cells(seeds, distance, known, parent_a, parent_b, solid, width, height):
+    # Fast marching over flat per-cell buffers, starting from the seed cells at their current
+    # distance: accept cells in order of distance; each accepted cell updates its four neighbours by
+    # solving |grad d| = 1 from the accepted values around them. The (up to two) neighbours a value
+    # was solved from are kept as its parents. Runs as plain Python on lists or memoryviews and is
+    # compiled unchanged by numba_kernels, with the same results.
+    inf = math.inf
+    heap = [(inf, -1)]  # never accepted; it gives numba the type of the heap entries
+    for cell in seeds:
+        heapq.heappush(heap, (distance[cell], cell))
+    while heap:
+        _, cell = heapq.heappop(heap)
+        if cell < 0 or known[cell]:
+            continue
+        known[cell] = True
+        y = cell // width
+        x = cell - y * width
+        for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if not (0 <= nx < width and 0 <= ny < height):
+                continue
+            neighbour = ny * width + nx
+            if known[neighbour] or solid[neighbour]:
+                continue
+            a, a_cell = inf, -1
+            if nx > 0 and known[neighbour - 1]:
+                a, a_cell = distance[neighbour - 1], neighbour - 1
+            if nx < width - 1 and known[neighbour + 1] and distance[neighbour + 1] < a:
+                a, a_cell = distance[neighbour + 1], neighbour + 1
+            b, b_cell = inf, -1
+            if ny > 0 and known[neighbour - width]:
+                b, b_cell = distance[neighbour - width], neighbour - width
+            if ny < height - 1 and known[neighbour + width] and distance[neighbour + width] < b:
+                b, b_cell = distance[neighbour + width], neighbour + width
+            if a > b:
+                a, b, a_cell, b_cell = b, a, b_cell, a_cell
+            if b - a >= 1:
+                value, b_cell = a + 1, -1
+            else:
+                value = (a + b + math.sqrt(2 - (b - a) * (b - a))) / 2
+            if value < distance[neighbour]:
+                distance[neighbour] = value
+                parent_a[neighbour] = a_cell
+                parent_b[neighbour] = b_cell
+                heapq.heappush(heap, (value, neighbour))
+
+
+def dependent_cells(cells, parent_a, parent_b, found, width, height):
+    # The given cells and every cell whose value was derived from one of them (directly or further up
+    # the chain), found by walking to the neighbours that name a cell as their parent, so the cost
+    # depends only on how many cells are found. `found` is a per-cell flag buffer, False on entry.
+    # Plain Python or compiled, like march_cells.
+    lost = [cell for cell in cells]
+    for cell in lost:
+        found[cell] = True
+    i = 0
+    while i < len(lost):
+        cell = lost[i]
+        i += 1
+        y = cell // width
+        x = cell - y * width
+        for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if not (0 <= nx < width and 0 <= ny < height):
+                continue
+            child = ny * width + nx
+            if not found[child] and (parent_a[child] == cell or parent_b[child] == cell):
+                found[child] = True
+                lost.append(child)
+    return lost
+
+
+def field_headings(distance, solid, y0, y1, x0, x1):
+    # Downhill direction of the distance field for the cells [y0:y1, x0:x1]: the central-difference
+    # gradient where all eight neighbours are reachable (so it cannot point into a wall), otherwise a
+    # step to the neighbour that is closest to the goal
+    height, width = distance.shape
+    rows, columns = y1 - y0, x1 - x0
+    padded = np.full((rows + 2, columns + 2), np.inf)
+    walls = np.ones((rows + 2, columns + 2), dtype=bool)
+    top, bottom, left, right = max(y0 - 1, 0), min(y1 + 1, height), max(x0 - 1, 0), min(x1 + 1, width)
+    inner = (slice(top - y0 + 1, bottom - y0 + 1), slice(left - x0 + 1, right - x0 + 1))
+    padded[inner] = distance[top:bottom, left:right]
+    walls[inner] = solid[top:bottom, left:right]
+
+    def shifted(array, dx, dy):
+        return array[1 + dy:1 + dy + rows, 1 + dx:1 + dx + columns]
+
+    with np.errstate(invalid='ignore'):
+        gx = shifted(padded, 1, 0) - shifted(padded, -1, 0)
+        gy = shifted(padded, 0, 1) - shifted(padded, 0, -1)
+        gradient = np.arctan2(-gy, -gx)
+    open_around = np.ones((rows, columns), dtype=bool)
+    for dx, dy, _ in MOVES:
+        open_around &= np.isfinite(shifted(padded, dx, dy))
+    smooth = open_around & ((gx != 0) | (gy != 0))
+
+    candidates = []
+    for dx, dy, cost in MOVES:
+        candidate = shifted(padded, dx, dy) + cost
+        if dx and dy:
+            candidate = np.where(shifted(walls, dx, 0) | shifted(walls, 0, dy), np.inf, candidate)
+        candidates.append(candidate)
+    candidates = np.array(candidates)
+    best = candidates.argmin(axis=0)
+    nearest = candidates.min(axis=0)
+    step_angles = np.array([np.arctan2(dy, dx) for dx, dy, _ in MOVES])
+    step = np.where(np.isfinite(nearest) & (nearest < shifted(padded, 0, 0)), step_angles[best], np.nan)
+    return np.where(smooth, gradient, step)
+
+
+class NavigationField:
+    # Obstacle-aware distance to a goal (a nest) for every cell of the grid, and the heading that
+    # leads downhill from each cell, so ants can look up their way home in O(1) and flow around
+    # walls. Distances come from a fast-marching (Dijkstra-style) sweep of the eikonal equation,
+    # which unlike plain 8-neighbour Dijkstra gives straight, true-bearing headings in the open.
+    # The march is compiled with numba when it is installed.
+    # The field follows the ObstacleMap's version: added obstacles are repaired in place by
+    # re-marching only the cells whose value depended on them; anything else (obstacles removed or
+    # replaced) triggers a full recompute. With background=True (the window) full computes run on a
+    # thread into new arrays that are swapped in when done; until the first one is, there is no
+    # field and ants head straight for the goal.
+    def __init__(self, obstacles, goal, background=False):
+        self.obstacles = obstacles
+        self.width, self.height = obstacles.width, obstacles.height
+        self.goal = (min(max(int(goal[0]), 0), self.width - 1), min(max(int(goal[1]), 0), self.height - 1))
+        self.distance = np.full((self.height, self.width), np.inf)
+        self.headings = np.full((self.height, self.width), np.nan)
+        self.parents = np.full((2, self.width * self.height), -1, dtype=np.int64)
+        self.known = np.zeros(self.width * self.height, dtype=bool)
+        self.solid = None
+        self.version = None
+        self.background = background
+        self.computing = None  # thread of a background compute
+
+    def refresh(self):
+        # Bring the field up to date with the obstacles; cheap when nothing changed
+        if self.computing is not None:
+            if self.computing.is_alive():
+                return
+            self.computing = None
+        if self.version == self.obstacles.version and self.solid is not None:
+            return
+        solid, version = self.obstacles.solid, self.obstacles.version
+        if self.solid is None or (self.solid & ~solid).any():
+            if self.background:
+                self.computing = threading.Thread(target=self.compute, args=(solid.copy(), version),
+                                                  name='navigation', daemon=True)
+                self.computing.start()
+            else:
+                self.compute(solid.copy(), version)
+            return
+        if (solid & ~self.solid).any():
+            self.repair(solid & ~self.solid, solid)
+        self.solid = solid.copy()
+        self.version = version
+
+    def compute(self, solid, version):
+        # Full sweep outwards from the goal cell. New arrays rather than in-place writes, so readers
+        # on other threads see the old field or the new one, never half of it.
+        width, height = self.width, self.height
+        size = width * height
+        distance = np.full(size, np.inf)
+        known = np.zeros(size, dtype=bool)
+        parents = np.full((2, size), -1, dtype=np.int64)
+        seeds = []
+        if not solid[self.goal[1], self.goal[0]]:
+            seeds = [self.goal[1] * width + self.goal[0]]
+            distance[seeds[0]] = 0.0
+        self.march(seeds, distance, known, parents, solid)
+        distance = distance.reshape(height, width)
+        headings = np.empty((height, width))
+        self.update_headings(headings, distance, solid, 0, height, 0, width)
+        self.distance, self.known, self.parents, self.headings = distance, known, parents, headings
+        self.solid = solid
+        self.version = version
+
+    def repair(self, added, solid):
+        # Only cells whose value was computed from a newly solid cell can change; they are cleared
+        # and marched again from the kept cells around them. Works in place and only on those cells
+        # (and the headings of the box around them), so a small edit stays cheap on a large grid.
+        width, height = self.width, self.height
+        distance, known, parents = self.distance.ravel(), self.known, self.parents
+        found = np.zeros(width * height, dtype=bool)
+        cells = np.flatnonzero(added.ravel())
+        kernels = compiled_kernels()
+        if kernels is not None:
+            lost = kernels.dependent_cells(cells, parents[0], parents[1], found, width, height)
+        else:
+            lost = dependent_cells(cells.tolist(), memoryview(parents[0]), memoryview(parents[1]),
+                                   memoryview(found), width, height)
+        lost = np.array(lost, dtype=np.int64)
+        distance[lost] = np.inf
+        known[lost] = False
+        parents[:, lost] = -1
+
+        ys, xs = np.divmod(lost, width)
+        border = []
+        for dx, dy, _ in MOVES[:4]:
+            nx, ny = xs + dx, ys + dy
+            inside = (nx >= 0) & (nx < width) & (ny >= 0) & (ny < height)
+            border.append(ny[inside] * width + nx[inside])
+        # Cells next to two lost ones come twice; the march accepts them once
+        border = np.concatenate(border)
+        border = border[known[border] & np.isfinite(distance[border])]
+        known[border] = False
+        self.march(border, distance, known, parents, solid)
+
+        self.update_headings(self.headings, self.distance, solid, max(ys.min() - 1, 0), min(ys.max() + 2, height),
+                             max(xs.min() - 1, 0), min(xs.max() + 2, width))
+
+    def update_headings(self, headings, distance, solid, y0, y1, x0, x1):
+        for y in range(y0, y1, HEADING_ROWS):
+            bottom = min(y + HEADING_ROWS, y1)
+            headings[y:bottom, x0:x1] = field_headings(distance, solid, y, bottom, x0, x1)
+
+    def march(self, seeds, distance, known, parents, solid):
+        kernels = compiled_kernels()
+        if kernels is not None:
+            kernels.march_cells(np.asarray(seeds, dtype=np.int64), distance, known, parents[0], parents[1],
+                                solid.ravel(), self.width, self.height)
+        else:
+            march_cells(np.asarray(seeds, dtype=np.int64).tolist(), memoryview(distance), memoryview(known),
+                        memoryview(parents[0]), memoryview(parents[1]), memoryview(solid.ravel()),
+                        self.width, self.height)
+
+    def cells(self, positions):
+        x = np.clip(positions[:, 0].astype(int), 0, self.width - 1)
+        y = np.clip(positions[:, 1].astype(int), 0, self.height - 1)
+        return x, y
+
+    def headings_at(self, positions):
+        # Heading towards the goal for each position; NaN where the field has none
+        # (unreachable cells and the goal cell itself, where ants should head straight for the goal)
+        self.refresh()
+        x, y = self.cells(positions)
+        headings = self.headings[y, x]
+        headings[(x == self.goal[0]) & (y == self.goal[1])] = np.nan
+        return headings
+
+    def distances_at(self, positions):
+        self.refresh()
+        x, y = self.cells(positions)
+        return self.distance[y, x]
@@ -0,0 +1,117 @@
+import numpy as np
+from numba import njit
+import navigation
+
+# Compiled versions of the NumpyBackend kernels (see backend.py). Every loop does the same floating
+# point operations in the same order as the NumPy code, so both backends give bit-identical runs.
+# Compiled code is cached next to this file, so only the first start after a change pays for it.
+EXPLORING = 0  # Ant.EXPLORING
+
+
+@njit(cache=True)
+def sample(field, x, y, width, height):
+    # Pheromone strength at a position, 0 outside the map (PheromoneMap.get_pheromone_strengths)
+    ix, iy = int(x), int(y)
+    if 0 <= ix < width and 0 <= iy < height:
+        return field[iy, ix]
+    return field.dtype.type(0)
+
+
+@njit(cache=True)
+def move_ants(positions, headings, states, stuck_time, nest_headings, random_rolls, random_angles,
+              return_field, solid, random_movement_chance, sensor_offset_distance, sensor_angle_offset,
+              max_turn_angle, speed, stuck_limit, width, height):
+    for i in range(len(headings)):
+        x, y, heading = positions[i, 0], positions[i, 1], headings[i]
+
+        # Wander, follow the strongest of three RETURN sensors, or head for the nest
+        if states[i] == EXPLORING:
+            if random_rolls[i] < random_movement_chance:
+                desired = random_angles[0, i]
+            else:
+                left_angle = heading - sensor_angle_offset
+                right_angle = heading + sensor_angle_offset
+                left = sample(return_field, x + sensor_offset_distance * np.cos(left_angle),
+                              y + sensor_offset_distance * np.sin(left_angle), width, height)
+                center = sample(return_field, x + sensor_offset_distance * np.cos(heading),
+                                y + sensor_offset_distance * np.sin(heading), width, height)
+                right = sample(return_field, x + sensor_offset_distance * np.cos(right_angle),
+                               y + sensor_offset_distance * np.sin(right_angle), width, height)
+                if center >= max(left, right):
+                    desired = heading
+                elif left > right:
+                    desired = heading - sensor_angle_offset
+                else:
+                    desired = heading + sensor_angle_offset
+        else:
+            desired = nest_headings[i]
+
+        # Turn, limited to max_turn_angle
+        angle_diff = (desired - heading + np.pi) % (2 * np.pi) - np.pi
+        heading += min(max(angle_diff, -max_turn_angle), max_turn_angle)
+        heading = (heading + np.pi) % (2 * np.pi) - np.pi
+
+        # Move unless the new position is off the map or solid; stuck ants pick a random heading
+        new_x = x + speed * np.cos(heading)
+        new_y = y + speed * np.sin(heading)
+        if 0 <= new_x < width and 0 <= new_y < height and not solid[int(new_y), int(new_x)]:
+            positions[i, 0] = new_x
+            positions[i, 1] = new_y
+            stuck_time[i] = 0
+        else:
+            stuck_time[i] += 1
+        if stuck_time[i] > stuck_limit:
+            heading = random_angles[1, i]
+            stuck_time[i] = 0
+        headings[i] = heading
+
+
+@njit(cache=True)
+def deposit_trails(search_field, return_field, positions, states):
+    height, width = search_field.shape
+    for i in range(len(states)):
+        ix, iy = int(positions[i, 0]), int(positions[i, 1])
+        if 0 <= ix < width and 0 <= iy < height:
+            if states[i] == EXPLORING:
+                search_field[iy, ix] += 1.0
+            else:
+                return_field[iy, ix] += 1.0
+
+
+@njit(cache=True)
+def evaporate_diffuse(field, back, self_weight, neighbour_weight, wrap, solid):
+    # One cell at a time, adding the neighbour shares in the order the NumPy kernel adds its slices
+    layers, height, width = field.shape
+    for layer in range(layers):
+        current, out = field[layer], back[layer]
+        for y in range(height):
+            for x in range(width):
+                if solid is not None and solid[y, x]:
+                    out[y, x] = 0
+                    continue
+                value = current[y, x] * self_weight[y, x]
+                if y > 0:
+                    value += current[y - 1, x] * neighbour_weight
+                if y < height - 1:
+                    value += current[y + 1, x] * neighbour_weight
+                if x > 0:
+                    value += current[y, x - 1] * neighbour_weight
+                if x < width - 1:
+                    value += current[y, x + 1] * neighbour_weight
+                if wrap:
+                    if y == 0:
+                        value += current[height - 1, x] * neighbour_weight
+                    if y == height - 1:
+                        value += current[0, x] * neighbour_weight
+                    if x == 0:
+                        value += current[y, width - 1] * neighbour_weight
+                    if x == width - 1:
+                        value += current[y, 0] * neighbour_weight
+                out[y, x] = value
+
+
+# The nest navigation field's march and its search for cells to repair (navigation.py), compiled
+# from the same Python code. They release the GIL, so a field computed on a thread does not hold
+# up the ticks.
+march_cells = njit(cache=True, nogil=True)(navigation.march_cells)
+dependent_cells = njit(cache=True, nogil=True)(navigation.dependent_cells)
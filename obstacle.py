@@ -14,3 +14,46 @@ class Obstacle:
         pos = (int(self.position[0] * cell_size), int(self.position[1] * cell_size))
         size = (int(self.size * cell_size), int(self.size * cell_size))
         pygame.draw.rect(screen, (128, 128, 128), pygame.Rect(pos, size))
+
+
+class ObstacleMap:
+    # Boolean occupancy raster of the grid; obstacles are written into it as they are added
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.solid = np.zeros((height, width), dtype=bool)
+        self.obstacles = []
+        self.version = 0
+
+    def __iter__(self):
+        return iter(self.obstacles)
+
+    def __len__(self):
+        return len(self.obstacles)
+
+    def add(self, obstacle):
+        # Keep the obstacle for drawing and mark the cells it covers
+        self.obstacles.append(obstacle)
+        x0, y0 = int(obstacle.position[0]), int(obstacle.position[1])
+        x1, y1 = int(np.ceil(obstacle.position[0] + obstacle.size)), int(np.ceil(obstacle.position[1] + obstacle.size))
+        self.solid[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)] = True
+        self.version += 1
+
+    def set_raster(self, solid):
+        # Replace every obstacle with a whole raster at once, e.g. a maze from a scenario file.
+        # Written in place, so views of the raster (such as the parallel engine's) stay valid.
+        self.obstacles = []
+        self.solid[...] = solid
+        self.version += 1
+
+    def is_solid(self, position):
+        x, y = int(position[0]), int(position[1])
+        return 0 <= x < self.width and 0 <= y < self.height and bool(self.solid[y, x])
+
+    def are_solid(self, positions):
+        # Batched is_solid for an (n, 2) array of positions; cells outside the grid are not solid
+        x, y = positions[:, 0].astype(int), positions[:, 1].astype(int)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        solid = np.zeros(len(positions), dtype=bool)
+        solid[inside] = self.solid[y[inside], x[inside]]
+        return solid
@@ -0,0 +1,403 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from events import EventType
+from food import Food, FoodIndex
+from navigation import NavigationField
+from obstacle import ObstacleMap
+from pheromone_map import PheromoneMap, diffusion_self_weight
+from swarm import Swarm
+
+
+class SharedArray:
+    # A NumPy array living in multiprocessing.shared_memory, attachable by name from other processes
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        if self.owner:
+            size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def spec(self):
+        return (self.shm.name, self.shape, self.dtype.str)
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class StripPheromones:
+    # What a worker's Swarm sees as its pheromone map: it senses the shared front buffer anywhere in
+    # the world, and deposits into the worker's own buffer covering its strip plus one halo row each side
+    def __init__(self, field, deposits, first_row, width, height):
+        self.field = field
+        self.deposits = deposits
+        self.first_row = first_row
+        self.width = width
+        self.height = height
+        self.front = 0
+
+    def get_pheromone_strengths(self, positions, pheromone_type):
+        x, y = positions[:, 0].astype(int), positions[:, 1].astype(int)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        strengths = np.zeros(len(positions))
+        strengths[inside] = self.field[self.front, pheromone_type, y[inside], x[inside]]
+        return strengths
+
+    def deposit_pheromones(self, positions, pheromone_type, amount=1.0):
+        x, y = positions[:, 0].astype(int), positions[:, 1].astype(int) - self.first_row
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.deposits.shape[1])
+        np.add.at(self.deposits[pheromone_type], (y[inside], x[inside]), amount)
+
+
+class StripWorker:
+    # State of one worker process: the ants of rows [start, stop) and the pheromone rows it updates.
+    # The barrier is shared by all workers and separates moving the ants from diffusing.
+    def __init__(self, setup, barrier):
+        self.barrier = barrier
+        self.index = setup['index']
+        self.bounds = setup['bounds']
+        self.start, self.stop = self.bounds[self.index], self.bounds[self.index + 1]
+        self.width, self.height = setup['width'], setup['height']
+        self.field = SharedArray.attach(setup['field'])
+        self.deposits = SharedArray.attach(setup['deposits'])
+        self.solid = SharedArray.attach(setup['solid'])
+        self.boundary = setup['boundary']
+        self.evaporation_rate = setup['evaporation_rate']
+        self.diffusion_rate = setup['diffusion_rate']
+
+        self.swarm = Swarm(setup['nest_position'], self.width, self.height,
+                           rng=np.random.default_rng(setup['seed']))
+        for name, value in setup['swarm_parameters'].items():
+            setattr(self.swarm, name, value)
+        self.obstacles = ObstacleMap(self.width, self.height)
+        self.obstacles.solid = self.solid.array
+        if setup['nest_navigation']:
+            self.swarm.navigation = NavigationField(self.obstacles, self.swarm.nest_position)
+        rows = self.stop - self.start
+        self.pheromones = StripPheromones(self.field.array, self.deposits.array[self.index, :, :rows + 2],
+                                          self.start - 1, self.width, self.height)
+        self.foods = FoodIndex(self.width, self.height)
+        self.claimants = np.zeros(0, dtype=int)
+
+        # Reused buffers for the strip with its halo rows and for the diffusion step
+        layers = self.field.shape[1]
+        self.local = np.zeros((layers, rows + 2, self.width), dtype=self.field.dtype)
+        self.scaled = np.zeros_like(self.local)
+        self.self_weight = np.zeros((self.height, self.width), dtype=self.field.dtype)
+        self.weight_version = None
+
+    def handle(self, command, args):
+        return getattr(self, command)(*args)
+
+    def add(self, positions, headings, states, stuck_time):
+        self.swarm.add_ants(positions, headings, states, stuck_time)
+
+    def spawn(self, count, x, y):
+        self.swarm.spawn(count, x, y)
+
+    def claims(self, food_positions):
+        # Closest food pile in range for each exploring ant; the coordinator decides who gets food.
+        # Pile positions only come along (otherwise None) when they changed.
+        if food_positions is not None:
+            self.foods.foods = [Food(x, y) for x, y in food_positions]
+            self.foods.rebuild()
+        if not len(self.foods):
+            self.claimants = np.zeros(0, dtype=int)
+            return np.zeros(0, dtype=int)
+        self.claimants, piles = self.swarm.food_claims(self.foods)
+        return piles
+
+    def tick(self, granted, front, weight_version, immigrants, spawns, food_positions):
+        # A whole tick in one round trip: hand out the food granted on last tick's claims, take in the
+        # ants that crossed into this strip and new ones, move, wait until every worker has written
+        # its deposits, then diffuse and claim food for the next tick
+        self.swarm.grant_food(self.claimants[granted])
+        if immigrants is not None:
+            self.add(*immigrants)
+        for spawn in spawns:
+            self.spawn(*spawn)
+        delivered, emigrants = self.advance(front)
+        self.barrier.wait()
+        self.diffuse(front, weight_version)
+        return delivered, emigrants, self.claims(food_positions)
+
+    def advance(self, front):
+        # Move the ants, recording deposits locally, and hand back the ants that left the strip
+        self.pheromones.deposits.fill(0)
+        self.pheromones.front = front
+        delivered = self.swarm.food_delivered
+        self.swarm.advance(self.pheromones, self.obstacles)
+        rows = self.swarm.positions[:self.swarm.count, 1].astype(int)
+        leaving = (rows < self.start) | (rows >= self.stop)
+        return self.swarm.food_delivered - delivered, self.swarm.remove_ants(leaving)
+
+    def diffuse(self, front, weight_version):
+        # Evaporate and diffuse this strip from the front buffer (plus every worker's deposits)
+        # into the back buffer
+        if weight_version != self.weight_version:
+            solid = self.solid.array if self.boundary == 'obstacle' else None
+            diffusion_self_weight(self.evaporation_rate, self.diffusion_rate, self.boundary, solid, self.self_weight)
+            self.weight_version = weight_version
+            # The shared raster changed under this worker's ObstacleMap; let the navigation field see it
+            self.obstacles.version = weight_version
+
+        local, field = self.local, self.field.array
+        first, last = self.start - 1, self.stop + 1
+        local.fill(0)
+        low, high = max(first, 0), min(last, self.height)
+        local[:, low - first:high - first] = field[front, :, low:high]
+        for worker in range(len(self.bounds) - 1):
+            worker_first = self.bounds[worker] - 1
+            worker_last = self.bounds[worker + 1] + 1
+            low, high = max(first, worker_first), min(last, worker_last)
+            if low < high:
+                local[:, low - first:high - first] += self.deposits.array[worker, :, low - worker_first:high - worker_first]
+
+        neighbour_weight = self.evaporation_rate * self.diffusion_rate / 8
+        out = field[1 - front, :, self.start:self.stop]
+        np.multiply(local[:, 1:-1], self.self_weight[self.start:self.stop], out=out)
+        np.multiply(local, neighbour_weight, out=self.scaled)
+        out += self.scaled[:, :-2]
+        out += self.scaled[:, 2:]
+        out[:, :, 1:] += self.scaled[:, 1:-1, :-1]
+        out[:, :, :-1] += self.scaled[:, 1:-1, 1:]
+        if self.boundary == 'obstacle':
+            out[:, self.solid.array[self.start:self.stop]] = 0
+
+    def gather(self):
+        n = self.swarm.count
+        return (self.swarm.positions[:n].copy(), self.swarm.headings[:n].copy(),
+                self.swarm.states[:n].copy(), self.swarm.stuck_time[:n].copy())
+
+    def close(self):
+        self.swarm = None
+        self.pheromones = None
+        self.obstacles = None
+        for shared in (self.field, self.deposits, self.solid):
+            shared.close()
+
+
+def worker_main(conn, setup, barrier):
+    worker = StripWorker(setup, barrier)
+    try:
+        while True:
+            command, args = conn.recv()
+            if command == 'stop':
+                break
+            conn.send(worker.handle(command, args))
+    except BaseException:
+        # Let the other workers out of the barrier rather than have them wait for this one forever
+        barrier.abort()
+        raise
+    finally:
+        worker.close()
+        conn.close()
+
+
+class ParallelEngine:
+    # Runs the first colony of a Simulation across worker processes, each owning a horizontal strip
+    # of the world. The pheromone field is double buffered in shared memory; each tick the workers
+    # (1) move their ants, recording deposits in per-worker buffers, then, after a barrier, (2)
+    # evaporate and diffuse their own rows, reading one halo row from each neighbour. That is one
+    # message to and from every worker per tick; it carries the ants that crossed into another strip
+    # (they join it on the next tick), and the food positions only when piles were added or removed.
+    # Food pickup is arbitrated by the coordinator so piles are never over-drawn. While the engine
+    # runs, the simulation's PheromoneMap and ObstacleMap are views of the shared buffers.
+    def __init__(self, sim, workers=None):
+        pheromone_map = sim.pheromone_map
+        if len(sim.colonies) > 1:
+            raise ValueError("The parallel engine only runs a single colony")
+        if not isinstance(pheromone_map, PheromoneMap) or pheromone_map.boundary == 'wrap':
+            raise ValueError("The parallel engine needs a dense PheromoneMap with a non-wrapping boundary")
+        if sim.swarm.speed > 1:
+            raise ValueError("Ants may move at most one row per tick between strips")
+        self.sim = sim
+        width, height = pheromone_map.width, pheromone_map.height
+        workers = max(1, min(workers or os.cpu_count() or 1, height // 2))
+        self.bounds = [int(row) for row in np.linspace(0, height, workers + 1)]
+        self.strip_starts = np.array(self.bounds[1:-1])
+        rows = max(np.diff(self.bounds))
+
+        # Shared memory and worker processes are released again if any worker fails to start
+        self.shared = []
+        self.connections = []
+        self.processes = []
+        self.solid_before = sim.obstacles.solid
+        self.field_before = pheromone_map.field
+        try:
+            self.start(sim, pheromone_map, workers, width, height, rows)
+        except BaseException:
+            self.abort()
+            raise
+
+    def start(self, sim, pheromone_map, workers, width, height, rows):
+        # Shared memory: both pheromone buffers, the per-worker deposit buffers and the obstacle raster.
+        # The simulation's ObstacleMap writes straight into the shared raster from now on.
+        self.field = self.share((2,) + pheromone_map.field.shape, pheromone_map.dtype)
+        self.field.array[0] = pheromone_map.field
+        self.front = 0
+        self.show_front()
+        self.deposits = self.share((workers, pheromone_map.field.shape[0], rows + 2, width), pheromone_map.dtype)
+        self.deposits.array.fill(0)
+        self.solid = self.share((height, width), bool)
+        self.solid.array[:] = sim.obstacles.solid
+        sim.obstacles.solid = self.solid.array
+
+        seeds = np.random.SeedSequence(int(sim.swarm.rng.integers(2**63))).spawn(workers)
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(workers)
+        for index in range(workers):
+            setup = {
+                'index': index, 'bounds': self.bounds, 'width': width, 'height': height,
+                'field': self.field.spec(), 'deposits': self.deposits.spec(), 'solid': self.solid.spec(),
+                'boundary': pheromone_map.boundary, 'evaporation_rate': pheromone_map.evaporation_rate,
+                'diffusion_rate': pheromone_map.diffusion_rate, 'nest_position': tuple(sim.swarm.nest_position),
+                'seed': seeds[index], 'swarm_parameters': {name: getattr(sim.swarm, name) for name in Swarm.PARAMETERS},
+                'nest_navigation': sim.swarm.navigation is not None,
+            }
+            parent, child = context.Pipe()
+            process = context.Process(target=worker_main, args=(child, setup, barrier), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+        # Hand the existing ants to the strips that own them; they only leave the swarm once every
+        # worker has started
+        self.ant_count = len(sim.swarm)
+        self.pending_spawns = []
+        self.moving = [None] * workers  # ants on their way to another strip, per receiving worker
+        self.food_key = None
+        self.ticks = 0
+        self.gathered = None  # tick count at which the ants were last copied into the simulation
+        ants = tuple(array[:len(sim.swarm)].copy() for array in
+                     (sim.swarm.positions, sim.swarm.headings, sim.swarm.states, sim.swarm.stuck_time))
+        self.broadcast('add', self.route(ants))
+        self.claims = self.broadcast('claims', [(self.food_positions(),)] * workers)
+        sim.swarm.remove_ants(np.ones(len(sim.swarm), dtype=bool))
+
+    def share(self, shape, dtype):
+        shared = SharedArray(shape, dtype)
+        self.shared.append(shared)
+        return shared
+
+    def abort(self):
+        # Undo a failed start: stop the workers that did start and free the shared memory
+        self.sim.obstacles.solid = self.solid_before
+        self.sim.pheromone_map.field = self.field_before
+        self.sim.pheromone_map.bind_views()
+        for connection in self.connections:
+            connection.close()
+        for process in self.processes:
+            process.terminate()
+            process.join()
+        for shared in self.shared:
+            shared.close()
+
+    def food_positions(self):
+        # The pile positions if piles were added or removed since the workers last got them, else None
+        foods = self.sim.foods
+        if (id(foods), foods.version) == self.food_key:
+            return None
+        self.food_key = (id(foods), foods.version)
+        return foods.positions.copy()
+
+    def show_front(self):
+        # Point the simulation's PheromoneMap at the shared front buffer, so drawing, recording and
+        # checking the field need no copy of it
+        pheromone_map = self.sim.pheromone_map
+        pheromone_map.field = self.field.array[self.front]
+        pheromone_map.bind_views()
+
+    def route(self, ants):
+        # Split ant arrays by the strip that owns each ant's row
+        owners = np.searchsorted(self.strip_starts, ants[0][:, 1].astype(int), side='right')
+        return [tuple(array[owners == worker] for array in ants) for worker in range(len(self.connections))]
+
+    def broadcast(self, command, per_worker_args):
+        for connection, args in zip(self.connections, per_worker_args):
+            connection.send((command, args))
+        return [connection.recv() for connection in self.connections]
+
+    def spawn(self, count, x, y):
+        # Queued until the next step, which hands each batch to the worker owning its row
+        self.pending_spawns.append((count, x, y))
+        self.ant_count += count
+
+    def step(self):
+        # Resolve last tick's food claims in worker order, then run a tick on every worker
+        claims = np.concatenate(self.claims)
+        granted = self.sim.foods.take(claims)
+        grants = np.split(granted, np.cumsum([len(piles) for piles in self.claims])[:-1])
+        # The workers own the ants, so pickups are recorded at the piles and deliveries as one batch at the nest
+        events = self.sim.events
+        events.record_many(EventType.FOOD_TAKEN, self.sim.foods.positions[claims[granted]])
+        self.sim.remove_depleted_food()
+
+        spawns = [[] for _ in self.connections]
+        for spawn in self.pending_spawns:
+            spawns[int(np.searchsorted(self.strip_starts, int(spawn[2]), side='right'))].append(spawn)
+        food_positions = self.food_positions()
+        version = self.sim.obstacles.version
+        results = self.broadcast('tick', [
+            (grants[worker], self.front, version, self.moving[worker], spawns[worker], food_positions)
+            for worker in range(len(self.connections))])
+        self.pending_spawns = []
+        self.front = 1 - self.front
+        self.show_front()
+        self.ticks += 1
+
+        delivered = sum(delivered for delivered, _, _ in results)
+        self.sim.swarm.food_delivered += delivered
+        if delivered:
+            events.record(EventType.FOOD_DELIVERED, *self.sim.swarm.nest_position, count=delivered)
+        moved = tuple(np.concatenate([ants[part] for _, ants, _ in results]) for part in range(4))
+        self.moving = [ants if len(ants[1]) else None for ants in self.route(moved)]
+        self.claims = [claims for _, _, claims in results]
+
+    def gather(self):
+        # Copy the ants back into the simulation, e.g. for drawing or recording; at most once a tick,
+        # however many frames and recorders ask. The pheromone field needs no copy (see show_front).
+        if self.gathered == self.ticks:
+            return
+        swarm = self.sim.swarm
+        delivered = swarm.food_delivered
+        swarm.remove_ants(np.ones(len(swarm), dtype=bool))
+        for positions, headings, states, stuck_time in self.broadcast('gather', [()] * len(self.connections)):
+            swarm.add_ants(positions, headings, states, stuck_time)
+        for ants in self.moving:
+            if ants is not None:
+                swarm.add_ants(*ants)
+        swarm.food_delivered = delivered
+        self.gathered = self.ticks
+
+    def close(self):
+        # Bring the final state back into the simulation and shut the workers down
+        self.gather()
+        for count, x, y in self.pending_spawns:
+            self.sim.swarm.spawn(count, x, y)
+        self.sim.obstacles.solid = self.solid.array.copy()
+        pheromone_map = self.sim.pheromone_map
+        self.field_before[...] = pheromone_map.field
+        pheromone_map.field = self.field_before
+        pheromone_map.bind_views()
+        for connection in self.connections:
+            connection.send(('stop', ()))
+            connection.close()
+        for process in self.processes:
+            process.join()
+        for shared in self.shared:
+            shared.close()
@@ -5,18 +5,45 @@ class PheromoneType:
     # Different types of pheromones
     SEARCH = 0
     RETURN = 1
+    ALL = (SEARCH, RETURN)
+
+# (SEARCH, RETURN) colours of each colony's trails; the first colony keeps the PheromoneRenderer defaults
+COLONY_COLORS = (((0, 255, 0), (255, 0, 0)), ((0, 140, 255), (160, 0, 255)),
+                 ((255, 200, 0), (255, 100, 0)), ((0, 200, 180), (120, 60, 20)))
 
 class PheromoneMap:
-    def __init__(self, width, height):
+    # How diffusion treats the edges of the map: wrap around (torus), reflect back in,
+    # absorb (pheromone leaves the map), or reflect at the edges and at obstacle cells too
+    BOUNDARY_MODES = ('wrap', 'reflect', 'absorb', 'obstacle')
+
+    def __init__(self, width, height, dtype=np.float64, boundary='reflect', obstacles=None):
         # Set up the pheromone map
+        if boundary not in self.BOUNDARY_MODES:
+            raise ValueError(f"Unknown boundary mode {boundary!r}, expected one of {self.BOUNDARY_MODES}")
+        if boundary == 'obstacle' and obstacles is None:
+            raise ValueError("The 'obstacle' boundary mode needs an ObstacleMap")
         self.width = width
         self.height = height
-        self.pheromones = {
-            PheromoneType.SEARCH: np.zeros((height, width)),
-            PheromoneType.RETURN: np.zeros((height, width))
-        }
+        self.dtype = np.dtype(dtype)
+        self.boundary = boundary
+        self.obstacles = obstacles
         self.evaporation_rate = 0.995
         self.diffusion_rate = 0.1
+        self.renderer = None
+
+        # All pheromone types live in one stacked (type, y, x) array, double buffered so that
+        # update() never allocates; `pheromones` holds per-type views of the current buffer
+        shape = (len(PheromoneType.ALL), height, width)
+        self.field = np.zeros(shape, dtype=self.dtype)
+        self.back = np.zeros(shape, dtype=self.dtype)
+        self.scaled = np.zeros(shape, dtype=self.dtype)
+        self.self_weight = np.zeros((height, width), dtype=self.dtype)
+        self.weight_key = None
+        self.evaporate_diffuse = evaporate_diffuse  # replaced by a compute backend's kernel, see backend.py
+        self.bind_views()
+
+    def bind_views(self):
+        self.pheromones = {ptype: self.field[ptype] for ptype in PheromoneType.ALL}
 
     def deposit_pheromone(self, position, pheromone_type, amount=1.0):
         # Add pheromones to a specific location
@@ -24,19 +51,28 @@ class PheromoneMap:
         if 0 <= x < self.width and 0 <= y < self.height:
             self.pheromones[pheromone_type][y, x] += amount
 
+    def deposit_pheromones(self, positions, pheromone_type, amount=1.0):
+        # Batched deposit for an (n, 2) array of positions; repeated cells accumulate
+        x, y = positions[:, 0].astype(int), positions[:, 1].astype(int)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        np.add.at(self.pheromones[pheromone_type], (y[inside], x[inside]), amount)
+
     def update(self):
-        # Update pheromone levels (evaporation and diffusion)
-        for ptype in self.pheromones:
-            self.pheromones[ptype] *= self.evaporation_rate
-            self.pheromones[ptype] = self.diffuse(self.pheromones[ptype])
-
-    def diffuse(self, pheromone):
-        # Spread pheromones to nearby cells
-        return pheromone * (1 - self.diffusion_rate) + \
-               np.roll(pheromone, 1, axis=0) * self.diffusion_rate / 8 + \
-               np.roll(pheromone, -1, axis=0) * self.diffusion_rate / 8 + \
-               np.roll(pheromone, 1, axis=1) * self.diffusion_rate / 8 + \
-               np.roll(pheromone, -1, axis=1) * self.diffusion_rate / 8
+        # One evaporate+diffuse step into the back buffer (by the compute backend's kernel), then swap
+        self.update_weights()
+        self.evaporate_diffuse(self, self.evaporation_rate * self.diffusion_rate / 8)
+        self.field, self.back = self.back, self.field
+        self.bind_views()
+
+    def update_weights(self):
+        # The self weights only change with the rates, the boundary mode or the obstacle layout
+        version = self.obstacles.version if self.boundary == 'obstacle' else None
+        key = (self.evaporation_rate, self.diffusion_rate, self.boundary, version)
+        if key == self.weight_key:
+            return
+        self.weight_key = key
+        solid = self.obstacles.solid if self.boundary == 'obstacle' else None
+        diffusion_self_weight(self.evaporation_rate, self.diffusion_rate, self.boundary, solid, self.self_weight)
 
     def get_pheromone_strength(self, position, pheromone_type):
         # Get the strength of pheromones at a specific location
@@ -45,22 +81,111 @@ class PheromoneMap:
             return self.pheromones[pheromone_type][y, x]
         return 0.0
 
+    def get_pheromone_strengths(self, positions, pheromone_type):
+        # Batched get_pheromone_strength for an (n, 2) array of positions
+        x, y = positions[:, 0].astype(int), positions[:, 1].astype(int)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        strengths = np.zeros(len(positions))
+        strengths[inside] = self.pheromones[pheromone_type][y[inside], x[inside]]
+        return strengths
+
     def draw(self, screen, cell_size):
         # Visualizing the pheromone trails on the screen
-        search_surface = pygame.Surface((self.width * cell_size, self.height * cell_size), pygame.SRCALPHA)
-        return_surface = pygame.Surface((self.width * cell_size, self.height * cell_size), pygame.SRCALPHA)
-
-        for y in range(self.height):
-            for x in range(self.width):
-                search_strength = min(self.pheromones[PheromoneType.SEARCH][y, x] * 255, 255)
-                return_strength = min(self.pheromones[PheromoneType.RETURN][y, x] * 255, 255)
-
-                if search_strength > 0:
-                    pygame.draw.rect(search_surface, (0, 255, 0, int(search_strength)),
-                                     (x * cell_size, y * cell_size, cell_size, cell_size))
-                if return_strength > 0:
-                    pygame.draw.rect(return_surface, (255, 0, 0, int(return_strength)),
-                                     (x * cell_size, y * cell_size, cell_size, cell_size))
-
-        screen.blit(search_surface, (0, 0))
-        screen.blit(return_surface, (0, 0))
+        if self.renderer is None or self.renderer.cell_size != cell_size:
+            self.renderer = PheromoneRenderer(self, cell_size)
+        self.renderer.draw(screen)
+
+
+def evaporate_diffuse(pheromone_map, neighbour_weight):
+    # Evaporation and diffusion fused into one pass over all pheromone types, into the back buffer:
+    # new = field * self_weight + (sum of the 4 neighbours) * evaporation * diffusion / 8
+    solid = pheromone_map.obstacles.solid if pheromone_map.boundary == 'obstacle' else None
+    evaporate_diffuse_stack(pheromone_map.field, pheromone_map.back, pheromone_map.scaled,
+                            pheromone_map.self_weight, neighbour_weight, pheromone_map.boundary, solid)
+
+
+def evaporate_diffuse_stack(field, back, scaled, self_weight, neighbour_weight, boundary, solid=None):
+    # The evaporate+diffuse step for any stack of (..., y, x) fields, e.g. the Grid's (type, colony, y, x)
+    np.multiply(field, self_weight, out=back)
+    np.multiply(field, neighbour_weight, out=scaled)
+    back[..., 1:, :] += scaled[..., :-1, :]
+    back[..., :-1, :] += scaled[..., 1:, :]
+    back[..., :, 1:] += scaled[..., :, :-1]
+    back[..., :, :-1] += scaled[..., :, 1:]
+    if boundary == 'wrap':
+        back[..., 0, :] += scaled[..., -1, :]
+        back[..., -1, :] += scaled[..., 0, :]
+        back[..., :, 0] += scaled[..., :, -1]
+        back[..., :, -1] += scaled[..., :, 0]
+    elif boundary == 'obstacle':
+        # Solid cells hold no pheromone, so nothing diffuses into or through them
+        back[..., solid] = 0
+
+
+def diffusion_self_weight(evaporation_rate, diffusion_rate, boundary, solid, out):
+    # Weight of a cell's own value in one evaporate+diffuse step: what stays after evaporation and
+    # diffusion, plus one neighbour share for every side that is reflected back (map edge or obstacle)
+    height, width = out.shape
+    neighbour_weight = evaporation_rate * diffusion_rate / 8
+    out.fill(evaporation_rate * (1 - diffusion_rate))
+    if boundary in ('reflect', 'obstacle'):
+        blocked = np.zeros((height + 2, width + 2), dtype=bool)
+        blocked[0, :] = blocked[-1, :] = blocked[:, 0] = blocked[:, -1] = True
+        if boundary == 'obstacle':
+            blocked[1:-1, 1:-1] = solid
+        sides = (blocked[:-2, 1:-1].astype(int) + blocked[2:, 1:-1] + blocked[1:-1, :-2] + blocked[1:-1, 2:])
+        out += neighbour_weight * sides
+    return out
+
+
+class PheromoneRenderer:
+    # Turns the SEARCH and RETURN fields into one RGBA image in a single vectorized pass
+    SEARCH_COLOR = (0, 255, 0)
+    RETURN_COLOR = (255, 0, 0)
+
+    def __init__(self, pheromone_map, cell_size, redraw_every=1, colors=None):
+        self.pheromone_map = pheromone_map
+        self.search_color, self.return_color = colors or (self.SEARCH_COLOR, self.RETURN_COLOR)
+        self.cell_size = cell_size
+        self.redraw_every = redraw_every
+        self.frame = 0
+        width, height = pheromone_map.width, pheromone_map.height
+
+        # Buffers are allocated once and reused every frame
+        self.image = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.scaled = pygame.Surface((width * cell_size, height * cell_size), pygame.SRCALPHA)
+        self.search_alpha = np.zeros((height, width), dtype=np.float32)
+        self.return_alpha = np.zeros((height, width), dtype=np.float32)
+        self.alpha = np.zeros((height, width), dtype=np.float32)
+        self.rgb = np.zeros((height, width, 3), dtype=np.float32)
+
+    def draw(self, screen):
+        # Only rebuild the image every `redraw_every` frames; the cached one is blitted in between
+        if self.frame % self.redraw_every == 0:
+            self.render()
+        self.frame += 1
+        screen.blit(self.scaled, (0, 0))
+
+    def render(self):
+        # Alpha of each layer is the strength clamped to [0, 1]
+        np.clip(self.pheromone_map.pheromones[PheromoneType.SEARCH], 0, 1, out=self.search_alpha)
+        np.clip(self.pheromone_map.pheromones[PheromoneType.RETURN], 0, 1, out=self.return_alpha)
+
+        # Composite RETURN over SEARCH: the search layer only shows through what return leaves uncovered
+        np.subtract(1, self.return_alpha, out=self.alpha)
+        self.search_alpha *= self.alpha
+        np.add(self.return_alpha, self.search_alpha, out=self.alpha)
+        for channel in range(3):
+            np.multiply(self.return_alpha, self.return_color[channel], out=self.rgb[..., channel])
+            self.rgb[..., channel] += self.search_alpha * self.search_color[channel]
+        np.divide(self.rgb, self.alpha[..., None], out=self.rgb, where=self.alpha[..., None] > 0)
+        self.alpha *= 255
+
+        # surfarray views are (x, y) ordered, the fields are (y, x)
+        pixels = pygame.surfarray.pixels3d(self.image)
+        pixels[...] = self.rgb.transpose(1, 0, 2)
+        del pixels
+        alpha = pygame.surfarray.pixels_alpha(self.image)
+        alpha[...] = self.alpha.T
+        del alpha
+        pygame.transform.scale(self.image, self.scaled.get_size(), self.scaled)
@@ -0,0 +1,120 @@
+import cProfile
+import csv
+import io
+import json
+import pstats
+import time
+import numpy as np
+
+
+class PhaseTimer:
+    # Context manager timing one phase into a ring buffer of the last `window` samples (in seconds)
+    def __init__(self, window):
+        self.samples = np.zeros(window)
+        self.count = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.samples[self.count % len(self.samples)] = time.perf_counter() - self.start
+        self.count += 1
+        return False
+
+    def recent(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+
+class NullTimer:
+    # Stand-in used while profiling is switched off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Profiler:
+    # Rolling per-phase timings of the simulation, plus on-demand cProfile sampling.
+    # Phases are timed with `with profiler.phase('name'):`; stats() gives p50/p95/max over the window.
+    def __init__(self, window=300, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self.timers = {}
+        self.cprofile = None
+        self.cprofile_ticks = 0
+        self.cprofile_path = None
+        self.last_report = None
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = PhaseTimer(self.window)
+        return timer
+
+    def reset(self):
+        self.timers = {}
+
+    def stats(self):
+        # {phase: {'p50', 'p95', 'max', 'mean'} in milliseconds, plus the number of samples}
+        stats = {}
+        for name, timer in self.timers.items():
+            samples = timer.recent() * 1000
+            if len(samples) == 0:
+                continue
+            p50, p95 = np.percentile(samples, (50, 95))
+            stats[name] = {'p50': float(p50), 'p95': float(p95), 'max': float(samples.max()),
+                           'mean': float(samples.mean()), 'count': timer.count}
+        return stats
+
+    def dump(self, path):
+        # Write stats() as CSV or JSON, depending on the file extension
+        stats = self.stats()
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['phase', 'p50_ms', 'p95_ms', 'max_ms', 'mean_ms', 'count'])
+                for name, values in stats.items():
+                    writer.writerow([name, values['p50'], values['p95'], values['max'], values['mean'], values['count']])
+        else:
+            with open(path, 'w') as file:
+                json.dump({'window': self.window, 'phases': stats}, file, indent=2)
+
+    # cProfile sampling: start_cprofile(n) profiles everything until n more ticks have run.
+    # With a path, the raw stats are also saved there for snakeviz/pstats.
+    def start_cprofile(self, ticks, path=None):
+        if self.cprofile is not None:
+            return False
+        self.cprofile = cProfile.Profile()
+        self.cprofile_ticks = ticks
+        self.cprofile_path = path
+        self.cprofile.enable()
+        return True
+
+    def tick(self):
+        # Called once per simulation tick; finishes a running cProfile sample when its ticks are up
+        if self.cprofile is None:
+            return None
+        self.cprofile_ticks -= 1
+        if self.cprofile_ticks > 0:
+            return None
+        return self.stop_cprofile()
+
+    def stop_cprofile(self, top=20):
+        # Stop sampling and return the report of the `top` hottest functions by own time
+        self.cprofile.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(self.cprofile, stream=output)
+        stats.sort_stats('tottime').print_stats(top)
+        if self.cprofile_path:
+            stats.dump_stats(self.cprofile_path)
+        self.cprofile = None
+        self.last_report = output.getvalue()
+        return self.last_report
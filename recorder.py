@@ -0,0 +1,322 @@
+import argparse
+import json
+import warnings
+import numpy as np
+import pygame
+from food import Food
+from simulation import Simulation, Button, GRID_WIDTH, GRID_HEIGHT, UI_HEIGHT, WIDTH
+
+# Pheromone fields can be stored quantized to save space
+PHEROMONE_FORMATS = {None: None, 'uint8': np.uint8, 'float16': np.float16}
+
+
+def frame_dtype(width, height, max_ants, max_foods, max_colonies, pheromones):
+    # Layout of one fixed-size frame in the log
+    fields = [
+        ('tick', np.int64),
+        ('ant_count', np.int32),
+        ('ant_positions', np.float32, (max_ants, 2)),
+        ('ant_states', np.int8, (max_ants,)),
+        ('ant_colonies', np.int8, (max_ants,)),
+        ('food_count', np.int32),
+        ('food_positions', np.float32, (max_foods, 2)),
+        ('food_amounts', np.int32, (max_foods,)),
+        ('food_initial_amounts', np.int32, (max_foods,)),
+        ('food_sizes', np.int8, (max_foods,)),
+        ('nest_count', np.int32),
+        ('nest_positions', np.float32, (max_colonies, 2)),
+        ('obstacles', np.uint8, ((width * height + 7) // 8,)),
+    ]
+    if pheromones is not None:
+        fields.append(('pheromones', PHEROMONE_FORMATS[pheromones], (2, height, width)))
+    return np.dtype(fields)
+
+
+class FrameRecorder:
+    # Appends per-tick frames to a preallocated memory-mapped .npy log (plus a small .json sidecar).
+    # Every frame has the same size, so any frame can be read without touching the ones before it.
+    # The sidecar is written when recording starts, without a frame count; close() fills that in.
+    # A recording that was never closed (a crash, Ctrl-C) can still be played back, see FrameLog.
+    def __init__(self, path, max_frames, every=1, max_ants=1000, max_foods=256, max_colonies=8,
+                 pheromones=None, pheromone_scale=1.0, width=GRID_WIDTH, height=GRID_HEIGHT):
+        if pheromones not in PHEROMONE_FORMATS:
+            raise ValueError(f"Unknown pheromone format {pheromones!r}, expected one of {list(PHEROMONE_FORMATS)}")
+        if max_colonies < 1:
+            raise ValueError("Frames need room for at least one nest")
+        self.path = path
+        self.every = every
+        self.pheromones = pheromones
+        self.pheromone_scale = pheromone_scale
+        self.width, self.height = width, height
+        self.dtype = frame_dtype(width, height, max_ants, max_foods, max_colonies, pheromones)
+        self.frames = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=(max_frames,))
+        self.count = 0
+        self.truncated = 0
+        self.write_metadata(None)
+
+    def write_metadata(self, frames):
+        meta = {
+            'frames': frames,
+            'every': self.every,
+            'width': self.width,
+            'height': self.height,
+            'pheromones': self.pheromones,
+            'pheromone_scale': self.pheromone_scale,
+            'truncated_frames': self.truncated,
+        }
+        with open(self.path + '.json', 'w') as file:
+            json.dump(meta, file)
+
+    def attach(self, sim):
+        sim.add_tick_observer(self.on_tick)
+
+    def detach(self, sim):
+        sim.remove_tick_observer(self.on_tick)
+
+    def on_tick(self, sim):
+        if sim.tick % self.every == 0:
+            self.record(sim)
+
+    def record(self, sim):
+        # Copy the current state into the next frame slot; when the log is full, later frames are dropped
+        if self.count >= len(self.frames):
+            return False
+        if sim.parallel is not None:
+            sim.parallel.gather()
+        frame = self.frames[self.count]
+        frame['tick'] = sim.tick
+
+        max_ants = frame['ant_states'].shape[0]
+        filled = 0
+        for colony in sim.colonies:
+            n = min(colony.swarm.count, max_ants - filled)
+            frame['ant_positions'][filled:filled + n] = colony.swarm.positions[:n]
+            frame['ant_states'][filled:filled + n] = colony.swarm.states[:n]
+            frame['ant_colonies'][filled:filled + n] = colony.colony_id
+            filled += n
+        frame['ant_count'] = filled
+
+        foods = list(sim.foods)[:frame['food_amounts'].shape[0]]
+        frame['food_count'] = len(foods)
+        for slot, food in enumerate(foods):
+            frame['food_positions'][slot] = food.position
+            frame['food_amounts'][slot] = food.amount
+            frame['food_initial_amounts'][slot] = food.initial_amount
+            frame['food_sizes'][slot] = food.size
+
+        nests = [colony.nest_position for colony in sim.colonies][:frame['nest_positions'].shape[0]]
+        frame['nest_positions'][:len(nests)] = nests
+        frame['obstacles'] = np.packbits(sim.obstacles.solid)
+
+        if self.pheromones is not None:
+            for ptype, field in sim.pheromone_map.pheromones.items():
+                if self.pheromones == 'uint8':
+                    frame['pheromones'][ptype] = np.clip(field * (255 / self.pheromone_scale) + 0.5, 0, 255)
+                else:
+                    frame['pheromones'][ptype] = field
+        # Written last: a frame with nests is complete, even in a recording that was never closed
+        frame['nest_count'] = len(nests)
+
+        if (filled < sum(colony.swarm.count for colony in sim.colonies) or len(foods) < len(sim.foods)
+                or len(nests) < len(sim.colonies)):
+            if self.truncated == 0:
+                warnings.warn(f"{self.path}: frame at tick {sim.tick} has more ants, food piles or nests than the "
+                              f"frame holds (max_ants={max_ants}, max_foods={len(frame['food_amounts'])}, "
+                              f"max_colonies={len(frame['nest_positions'])}); the extra ones are not recorded",
+                              stacklevel=2)
+            self.truncated += 1
+        self.count += 1
+        return True
+
+    def close(self):
+        self.frames.flush()
+        self.write_metadata(self.count)
+        self.frames = None
+        if self.truncated:
+            warnings.warn(f"{self.path}: {self.truncated} of {self.count} frames were truncated", stacklevel=2)
+
+
+class FrameLog:
+    # Read side of a recording: frames are memory-mapped, so seeking to any frame is O(1)
+    def __init__(self, path):
+        with open(path + '.json') as file:
+            self.meta = json.load(file)
+        frames = np.load(path, mmap_mode='r')
+        count = self.meta['frames']
+        if count is None:
+            count = self.written_frames(frames)
+            warnings.warn(f"{path} was not closed properly; found {count} recorded frames", stacklevel=2)
+        self.frames = frames[:count]
+
+    @staticmethod
+    def written_frames(frames):
+        # Frames are written in order and their nest count (never 0) last, while the slots after them
+        # are still zero; bisecting for the first empty slot only reads a few pages
+        low, high = 0, len(frames)
+        nest_counts = frames['nest_count']
+        while low < high:
+            middle = (low + high) // 2
+            if nest_counts[middle] > 0:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def pheromone_field(self, frame):
+        # De-quantized (2, height, width) pheromone field of a frame, or None if it was not recorded
+        if self.meta['pheromones'] is None:
+            return None
+        field = frame['pheromones'].astype(np.float64)
+        if self.meta['pheromones'] == 'uint8':
+            field *= self.meta['pheromone_scale'] / 255
+        return field
+
+
+class ReplayViewer:
+    # Plays a recording back through the normal Simulation drawing code, without simulating anything.
+    # Space plays/pauses, left/right step one frame, page up/down jump 100 frames, home/end jump to
+    # the ends, up/down change the playback speed (negative plays backwards), and clicking the bar
+    # right of the buttons seeks to that point of the recording.
+    SPEEDS = (-8, -4, -2, -1, -0.5, -0.25, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+    def __init__(self, path):
+        self.log = FrameLog(path)
+        self.sim = Simulation(grid_size=(self.log.meta['width'], self.log.meta['height']))
+        self.position = 0.0
+        self.speed_index = self.SPEEDS.index(1)
+        self.playing = False
+        self.obstacle_bits = None
+
+        button_width, button_height, button_margin = 160, 40, 10
+        self.sim.buttons = {
+            'play': Button(button_margin, 10, button_width, button_height, "Play", (0, 255, 0)),
+            'speed': Button(button_margin * 2 + button_width, 10, button_width, button_height, "Speed: 1x", (0, 0, 255)),
+            'frame': Button(button_margin * 3 + button_width * 2, 10, button_width * 2, button_height, "", (0, 0, 0)),
+        }
+        self.seek_bar_start = button_margin * 4 + button_width * 4
+
+    @property
+    def speed(self):
+        return self.SPEEDS[self.speed_index]
+
+    def seek(self, index):
+        self.position = float(min(max(index, 0), len(self.log) - 1))
+        self.load_frame(int(self.position))
+
+    def load_frame(self, index):
+        # Put the recorded state into the simulation so its draw() shows it
+        frame, sim = self.log[index], self.sim
+        sim.tick = int(frame['tick'])
+
+        nests = frame['nest_positions'][:frame['nest_count']].tolist()
+        while len(sim.colonies) < len(nests):
+            sim.add_colony(tuple(nests[len(sim.colonies)]))
+        for colony, nest in zip(sim.colonies, nests):
+            if list(colony.nest_position) != nest:
+                sim.move_nest(colony.colony_id, tuple(nest))
+        n = frame['ant_count']
+        colonies = frame['ant_colonies'][:n]
+        for colony in sim.colonies:
+            mine = colonies == colony.colony_id
+            swarm = colony.swarm
+            swarm.remove_ants(np.ones(swarm.count, dtype=bool))
+            swarm.add_ants(frame['ant_positions'][:n][mine], np.zeros(np.count_nonzero(mine)),
+                           frame['ant_states'][:n][mine], np.zeros(np.count_nonzero(mine), dtype=np.int32))
+
+        sim.foods.foods = []
+        for slot in range(frame['food_count']):
+            x, y = frame['food_positions'][slot]
+            food = Food(x, y, int(frame['food_sizes'][slot]))
+            food.amount = int(frame['food_amounts'][slot])
+            food.initial_amount = int(frame['food_initial_amounts'][slot])
+            sim.foods.foods.append(food)
+        sim.foods.rebuild()
+
+        # Obstacles only change when the user adds some, so the raster is only unpacked on change
+        bits = frame['obstacles']
+        if self.obstacle_bits is None or not np.array_equal(bits, self.obstacle_bits):
+            self.obstacle_bits = np.array(bits)
+            solid = np.unpackbits(bits)[:sim.obstacles.solid.size].reshape(sim.obstacles.solid.shape).astype(bool)
+            sim.obstacles.set_raster(solid)
+
+        field = self.log.pheromone_field(frame)
+        if field is None:
+            sim.pheromone_map.field.fill(0)
+        else:
+            sim.pheromone_map.field[...] = field
+        sim.pheromone_map.bind_views()
+
+        self.sim.buttons['frame'].text = f"Frame {index + 1}/{len(self.log)}  Tick {sim.tick}"
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.sim.running = False
+            elif event.type == pygame.KEYDOWN:
+                self.handle_key(event.key)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.pos[1] < UI_HEIGHT:
+                self.handle_click(event.pos)
+
+    def handle_key(self, key):
+        steps = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1, pygame.K_PAGEUP: -100, pygame.K_PAGEDOWN: 100}
+        if key == pygame.K_SPACE:
+            self.toggle_play()
+        elif key in steps:
+            self.seek(int(self.position) + steps[key])
+        elif key == pygame.K_HOME:
+            self.seek(0)
+        elif key == pygame.K_END:
+            self.seek(len(self.log) - 1)
+        elif key == pygame.K_UP:
+            self.change_speed(1)
+        elif key == pygame.K_DOWN:
+            self.change_speed(-1)
+
+    def handle_click(self, pos):
+        if self.sim.buttons['play'].rect.collidepoint(pos):
+            self.toggle_play()
+        elif self.sim.buttons['speed'].rect.collidepoint(pos):
+            self.change_speed(1 if self.speed_index + 1 < len(self.SPEEDS) else -len(self.SPEEDS) + 1)
+        elif pos[0] >= self.seek_bar_start:
+            fraction = (pos[0] - self.seek_bar_start) / max(WIDTH - self.seek_bar_start, 1)
+            self.seek(round(fraction * (len(self.log) - 1)))
+
+    def toggle_play(self):
+        self.playing = not self.playing
+        self.sim.buttons['play'].text = "Pause" if self.playing else "Play"
+
+    def change_speed(self, step):
+        self.speed_index = min(max(self.speed_index + step, 0), len(self.SPEEDS) - 1)
+        self.sim.buttons['speed'].text = f"Speed: {self.speed}x"
+
+    def run(self, start=0):
+        if len(self.log) == 0:
+            raise ValueError("The recording has no frames")
+        self.seek(start)
+        while self.sim.running:
+            self.handle_events()
+            if self.playing:
+                previous = int(self.position)
+                self.position = min(max(self.position + self.speed, 0), len(self.log) - 1)
+                if int(self.position) != previous:
+                    self.load_frame(int(self.position))
+            self.sim.draw()
+            self.sim.clock.tick(60)
+        pygame.quit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded simulation run.")
+    parser.add_argument('path', help="recording (.npy) written by FrameRecorder")
+    parser.add_argument('--start', type=int, default=0, help="frame to start at")
+    args = parser.parse_args(argv)
+    ReplayViewer(args.path).run(args.start)
+
+if __name__ == "__main__":
+    main()
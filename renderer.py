@@ -0,0 +1,165 @@
+import numpy as np
+import pygame
+from ant import Ant
+
+NEST_COLOR = (139, 69, 19)
+OBSTACLE_COLOR = (128, 128, 128)
+ANT_COLOR = (0, 0, 0)
+ANT_WITH_FOOD_COLOR = (255, 0, 0)
+UI_COLOR = (200, 200, 200)
+TRANSPARENT = (255, 0, 255)  # colorkey of the cached layers
+UNREACHABLE_COLOR = (220, 60, 60)
+NAVIGATION_BAND = 10  # cells between the contour lines of the navigation overlay
+
+
+class SceneRenderer:
+    # Draws the world part of the window from persistent surfaces. Nests and obstacles are kept in
+    # a cached layer that is only redrawn when they change; ants are written straight into the
+    # surface's pixel array from the swarm's position arrays.
+    def __init__(self, width, height, cell_size, nest_size):
+        self.cell_size = cell_size
+        self.nest_size = nest_size
+        self.surface = pygame.Surface((width, height), 0, 32)
+        self.static = pygame.Surface((width, height))
+        self.static.set_colorkey(TRANSPARENT, pygame.RLEACCEL)
+        self.static_key = None
+        self.navigation = None
+        self.navigation_key = None
+
+        # Pixel offsets of the circle Ant.draw draws, taken from pygame's own rendering of it. Below a
+        # cell size of 3 that circle is empty, and ants are drawn as a single pixel instead.
+        radius = self.ant_radius = cell_size // 3
+        sprite = pygame.Surface((2 * radius + 1, 2 * radius + 1))
+        sprite.fill(TRANSPARENT)
+        pygame.draw.circle(sprite, ANT_COLOR, (radius, radius), radius)
+        sprite.set_colorkey(TRANSPARENT)
+        footprint = pygame.mask.from_surface(sprite)
+        offsets = [(x - radius, y - radius) for x in range(2 * radius + 1)
+                   for y in range(2 * radius + 1) if footprint.get_at((x, y))]
+        self.ant_offsets = np.array(offsets or [(0, 0)], dtype=np.intp).reshape(-1, 2)
+        self.ant_colors = ((Ant.EXPLORING, ANT_COLOR), (Ant.RETURNING, ANT_WITH_FOOD_COLOR))
+
+    def draw(self, state, obstacle_version, profiler, show_navigation=False):
+        # Render the world of `state` (a Simulation or a FrameSnapshot) and return the surface
+        surface = self.surface
+        surface.fill((255, 255, 255))
+        with profiler.phase('draw_pheromones'):
+            state.pheromone_map.draw(surface, self.cell_size)
+            # Rival colonies' trails live in the Grid and are drawn over the first colony's
+            for colony in state.colonies[1:]:
+                colony.pheromones.draw(surface, self.cell_size)
+
+        with profiler.phase('draw_world'):
+            nests = tuple(tuple(colony.nest_position) for colony in state.colonies)
+            if show_navigation:
+                self.draw_navigation(surface, [colony.swarm.navigation for colony in state.colonies
+                                               if colony.swarm.navigation is not None
+                                               and colony.swarm.navigation.version is not None])
+            if self.static_key != (obstacle_version, nests):
+                self.draw_static(nests, state.obstacles)
+                self.static_key = (obstacle_version, nests)
+            surface.blit(self.static, (0, 0))
+            for food in state.foods:
+                food.draw(surface, self.cell_size)
+
+        with profiler.phase('draw_ants'):
+            for colony in state.colonies:
+                self.draw_ants(surface, colony.swarm)
+        return surface
+
+    def draw_static(self, nests, obstacles):
+        cell_size, nest_size = self.cell_size, self.nest_size
+        self.static.fill(TRANSPARENT)
+        for nest_x, nest_y in nests:
+            nest_points = [
+                (nest_x * cell_size, nest_y * cell_size),
+                ((nest_x + nest_size) * cell_size, nest_y * cell_size),
+                ((nest_x + nest_size // 2) * cell_size, (nest_y - nest_size) * cell_size)
+            ]
+            pygame.draw.polygon(self.static, NEST_COLOR, nest_points)
+
+        # Obstacles come from the raster, so a maze loaded in bulk costs the same as a few clicks;
+        # only the cells that fit on the surface are scaled up
+        width, height = self.static.get_size()
+        solid = obstacles.solid[:-(-height // cell_size), :-(-width // cell_size)]
+        if solid.any():
+            colors = np.where(solid.T[..., None], np.array(OBSTACLE_COLOR, dtype=np.uint8),
+                              np.array(TRANSPARENT, dtype=np.uint8))
+            layer = pygame.transform.scale(pygame.surfarray.make_surface(colors),
+                                           (solid.shape[1] * cell_size, solid.shape[0] * cell_size))
+            layer.set_colorkey(TRANSPARENT)
+            self.static.blit(layer, (0, 0))
+
+    def draw_navigation(self, surface, fields):
+        # Distance to the closest nest, light near a nest and darker further out, with contour lines;
+        # free cells no ant can get home from are red. Rebuilt only when a field changes.
+        if not fields:
+            return
+        key = tuple((id(field), field.version) for field in fields)
+        if key != self.navigation_key:
+            distance = np.minimum.reduce([field.distance for field in fields])
+            reachable = np.isfinite(distance)
+            far = distance[reachable].max() if reachable.any() else 1.0
+            distance = np.where(reachable, distance, 0.0)
+            shade = distance / max(far, 1.0)
+            colors = np.empty(distance.shape + (3,), dtype=np.uint8)
+            colors[..., 0] = 60 + 120 * shade
+            colors[..., 1] = 140 + 80 * shade
+            colors[..., 2] = 255 - 60 * shade
+            colors[reachable & (distance % NAVIGATION_BAND < 1)] = (30, 60, 140)
+            colors[~reachable] = UNREACHABLE_COLOR
+            colors[fields[0].obstacles.solid] = TRANSPARENT
+            cells = pygame.surfarray.make_surface(colors.transpose(1, 0, 2))
+            height, width = distance.shape
+            self.navigation = pygame.transform.scale(cells, (width * self.cell_size, height * self.cell_size))
+            self.navigation.set_colorkey(TRANSPARENT, pygame.RLEACCEL)
+            self.navigation.set_alpha(110, pygame.RLEACCEL)
+            self.navigation_key = key
+        surface.blit(self.navigation, (0, 0))
+
+    def draw_ants(self, surface, swarm):
+        # Every pixel of every ant's circle in one fancy-indexed write per colour
+        n = swarm.count
+        if n == 0:
+            return
+        centers = (swarm.positions[:n] * self.cell_size).astype(np.intp)
+        states = swarm.states[:n]
+        width, height = surface.get_size()
+        radius = self.ant_radius
+        pixels = pygame.surfarray.pixels2d(surface)  # (x, y) view of the surface memory
+        rows = pixels.T
+        flat = rows.reshape(-1) if rows.flags.c_contiguous else None
+        flat_offsets = self.ant_offsets[:, 1] * width + self.ant_offsets[:, 0]
+        for state, color in self.ant_colors:
+            selected = centers[states == state]
+            value = surface.map_rgb(color)
+
+            # Ants whose circle lies fully inside the surface are written through flat pixel indices,
+            # the few near the edges are clipped pixel by pixel
+            if flat is not None:
+                interior = ((selected[:, 0] >= radius) & (selected[:, 0] < width - radius) &
+                            (selected[:, 1] >= radius) & (selected[:, 1] < height - radius))
+                inner = selected[interior]
+                flat[((inner[:, 1] * width + inner[:, 0])[:, None] + flat_offsets).ravel()] = value
+                selected = selected[~interior]
+            x = (selected[:, 0, None] + self.ant_offsets[:, 0]).ravel()
+            y = (selected[:, 1, None] + self.ant_offsets[:, 1]).ravel()
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            pixels[x[inside], y[inside]] = value
+        del pixels, rows, flat
+
+
+class InterfaceRenderer:
+    # The UI bar with its buttons, cached until a button is added, moved or relabelled
+    def __init__(self, width, height):
+        self.surface = pygame.Surface((width, height))
+        self.key = None
+
+    def draw(self, buttons):
+        key = tuple((name, button.text, tuple(button.rect)) for name, button in buttons.items())
+        if key != self.key:
+            self.surface.fill(UI_COLOR)
+            for button in buttons.values():
+                button.draw(self.surface)
+            self.key = key
+        return self.surface
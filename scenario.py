@@ -0,0 +1,244 @@
+import json
+import os
+import numpy as np
+import pygame
+from config import SimulationConfig
+from food import Food
+
+# Bumped whenever the layout of .npz and .json scenarios changes
+SCENARIO_VERSION = 1
+# Colours of image scenarios, one pixel per grid cell; every pixel counts as the closest of these
+IMAGE_COLORS = {'empty': (255, 255, 255), 'wall': (0, 0, 0), 'food': (0, 255, 0), 'nest': (255, 0, 0)}
+# Food pixels of an image are gathered into piles of FOOD_SIZE x FOOD_SIZE cells
+FOOD_SIZE = 3
+
+
+class Scenario:
+    # A world to load into a simulation: the obstacle raster, the food piles (as arrays, so a big map
+    # never goes through per-object code until it is loaded), the nests and optionally the settings
+    def __init__(self, width, height, solid=None, food_positions=None, food_sizes=None, food_amounts=None,
+                 food_initial_amounts=None, nests=None, config=None):
+        self.width = width
+        self.height = height
+        self.solid = solid if solid is not None else np.zeros((height, width), dtype=bool)
+        self.food_positions = np.zeros((0, 2)) if food_positions is None else np.asarray(food_positions, dtype=float).reshape(-1, 2)
+        count = len(self.food_positions)
+        self.food_sizes = np.full(count, FOOD_SIZE, dtype=np.int64) if food_sizes is None else np.asarray(food_sizes, dtype=np.int64)
+        full = self.food_sizes * self.food_sizes * 5  # what a new Food pile of that size holds
+        self.food_amounts = full if food_amounts is None else np.asarray(food_amounts, dtype=np.int64)
+        self.food_initial_amounts = full if food_initial_amounts is None else np.asarray(food_initial_amounts, dtype=np.int64)
+        self.nests = np.zeros((0, 2), dtype=np.int64) if nests is None else np.asarray(nests, dtype=np.int64).reshape(-1, 2)
+        self.config = config  # a SimulationConfig.to_dict() dict, or None to keep the simulation's settings
+        if self.solid.shape != (height, width):
+            raise ValueError(f"Obstacle raster is {self.solid.shape[1]}x{self.solid.shape[0]}, expected {width}x{height}")
+
+    @property
+    def grid_size(self):
+        return self.width, self.height
+
+    def make_foods(self):
+        foods = []
+        for (x, y), size, amount, initial_amount in zip(self.food_positions.tolist(), self.food_sizes.tolist(),
+                                                        self.food_amounts.tolist(), self.food_initial_amounts.tolist()):
+            food = Food(x, y, size)
+            food.amount = amount
+            food.initial_amount = initial_amount
+            foods.append(food)
+        return foods
+
+    def simulation_config(self, config=None):
+        # Settings for a simulation built from this scenario; an explicit config wins
+        if config is not None or self.config is None:
+            return config
+        return SimulationConfig.from_dict(self.config)
+
+
+# The world of a running simulation as a Scenario
+def scenario_from_simulation(sim):
+    if sim.parallel is not None:
+        sim.parallel.gather()
+    foods = list(sim.foods)
+    return Scenario(sim.grid_width, sim.grid_height, sim.obstacles.solid.copy(),
+                    [food.position for food in foods], [food.size for food in foods],
+                    [food.amount for food in foods], [food.initial_amount for food in foods],
+                    [colony.nest_position for colony in sim.colonies], sim.config.to_dict())
+
+
+# Replace the world of a simulation with a scenario in one pass: the obstacle raster is copied in
+# as a whole, the food index is rebuilt once, colonies are moved to the scenario's nests (and added
+# for extra nests), and the scenario's settings are applied if it has any (and `settings` is true,
+# pass False when the simulation was built with the settings it should keep). Ants stay where they are.
+def apply_scenario(sim, scenario, settings=True):
+    if scenario.grid_size != (sim.grid_width, sim.grid_height):
+        raise ValueError(f"Scenario is {scenario.width}x{scenario.height} but the simulation is "
+                         f"{sim.grid_width}x{sim.grid_height}; build a new Simulation(grid_size=...) for it")
+    if sim.parallel is not None:
+        raise ValueError("Stop the parallel engine before loading a scenario")
+    if 0 < len(scenario.nests) < len(sim.colonies):
+        raise ValueError(f"Scenario has {len(scenario.nests)} nests but the simulation has {len(sim.colonies)} colonies")
+
+    settings = settings and scenario.config is not None
+    if settings:
+        sim.config = SimulationConfig.from_dict(scenario.config)
+        sim.config.apply_to_pheromones(sim.pheromone_map, sim.grid)
+        for colony in sim.colonies:
+            sim.config.apply_to_swarm(colony.swarm)
+    sim.obstacles.set_raster(scenario.solid)
+    sim.foods.foods = []
+    sim.foods.extend(scenario.make_foods())
+    for index, nest in enumerate(scenario.nests.tolist()):
+        if index < len(sim.colonies):
+            sim.move_nest(index, tuple(nest))
+        else:
+            sim.add_colony(tuple(nest))
+    if settings:
+        for colony in sim.colonies:
+            sim.config.apply_navigation(colony.swarm, sim.obstacles, not sim.headless)
+
+
+def load_scenario(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        return read_npz(path)
+    if extension == '.json':
+        return read_json(path)
+    return read_image(path)
+
+
+# Write the world of a simulation; the format follows the extension (.npz, .json or an image type)
+def save_scenario(sim, path):
+    scenario = scenario_from_simulation(sim)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        write_npz(scenario, path)
+    elif extension == '.json':
+        write_json(scenario, path)
+    else:
+        write_image(scenario, path)
+    return scenario
+
+
+# .npz: the rasters and food arrays as they are, plus a JSON metadata entry. The most compact and
+# fastest format for large maps, and the only one that keeps everything (food amounts, settings).
+def read_npz(path):
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if meta['version'] != SCENARIO_VERSION:
+            raise ValueError(f"Unsupported scenario version {meta['version']}")
+        return Scenario(meta['width'], meta['height'], data['solid'].astype(bool), data['food_positions'],
+                        data['food_sizes'], data['food_amounts'], data['food_initial_amounts'],
+                        data['nests'], meta.get('config'))
+
+
+def write_npz(scenario, path):
+    meta = {'version': SCENARIO_VERSION, 'width': scenario.width, 'height': scenario.height,
+            'config': scenario.config}
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), solid=scenario.solid,
+                        food_positions=scenario.food_positions, food_sizes=scenario.food_sizes,
+                        food_amounts=scenario.food_amounts, food_initial_amounts=scenario.food_initial_amounts,
+                        nests=scenario.nests)
+
+
+# .json: for hand-written worlds. Walls are rectangles [x, y, width, height], foods [x, y] or
+# [x, y, size] or [x, y, size, amount], nests [x, y]; "config" holds settings by name.
+#   {"width": 148, "height": 94, "walls": [[60, 20, 2, 50]], "foods": [[100, 40]], "nests": [[30, 47]]}
+def read_json(path):
+    with open(path) as file:
+        data = json.load(file)
+    if data.get('version', SCENARIO_VERSION) != SCENARIO_VERSION:
+        raise ValueError(f"Unsupported scenario version {data['version']}")
+    width, height = data['width'], data['height']
+    solid = np.zeros((height, width), dtype=bool)
+    for x, y, wall_width, wall_height in data.get('walls', ()):
+        solid[max(y, 0):max(y + wall_height, 0), max(x, 0):max(x + wall_width, 0)] = True
+
+    foods = data.get('foods', ())
+    sizes = np.array([food[2] if len(food) > 2 else FOOD_SIZE for food in foods], dtype=np.int64)
+    amounts = np.array([food[3] if len(food) > 3 else size * size * 5 for food, size in zip(foods, sizes.tolist())],
+                       dtype=np.int64)
+    return Scenario(width, height, solid, [food[:2] for food in foods], sizes, amounts,
+                    np.maximum(amounts, sizes * sizes * 5), data.get('nests'), data.get('config'))
+
+
+def write_json(scenario, path):
+    # Walls are written as the horizontal runs of solid cells in every row
+    padded = np.zeros((scenario.height, scenario.width + 2), dtype=np.int8)
+    padded[:, 1:-1] = scenario.solid
+    rows, starts = np.nonzero(np.diff(padded, axis=1) == 1)
+    _, ends = np.nonzero(np.diff(padded, axis=1) == -1)
+    walls = np.column_stack((starts, rows, ends - starts, np.ones_like(rows))).tolist()
+    foods = [[float(x), float(y), size, amount] for (x, y), size, amount in
+             zip(scenario.food_positions.tolist(), scenario.food_sizes.tolist(), scenario.food_amounts.tolist())]
+    data = {'version': SCENARIO_VERSION, 'width': scenario.width, 'height': scenario.height,
+            'walls': walls, 'foods': foods, 'nests': scenario.nests.tolist()}
+    if scenario.config is not None:
+        data['config'] = scenario.config
+    with open(path, 'w') as file:
+        json.dump(data, file)
+
+
+# Images (.png, .bmp, ...): one pixel per cell, coloured as in IMAGE_COLORS. Food pixels become full
+# piles on a FOOD_SIZE grid and every blob of nest pixels one nest at its centre. Settings and food
+# amounts are not stored.
+def read_image(path):
+    pixels = pygame.surfarray.array3d(pygame.image.load(path)).transpose(1, 0, 2)
+    height, width = pixels.shape[:2]
+    kinds = classify_colors(pixels)
+    names = list(IMAGE_COLORS)
+
+    food = kinds == names.index('food')
+    blocks = np.zeros((-(-height // FOOD_SIZE) * FOOD_SIZE, -(-width // FOOD_SIZE) * FOOD_SIZE), dtype=bool)
+    blocks[:height, :width] = food
+    blocks = blocks.reshape(blocks.shape[0] // FOOD_SIZE, FOOD_SIZE, blocks.shape[1] // FOOD_SIZE, FOOD_SIZE).any(axis=(1, 3))
+    pile_rows, pile_cols = np.nonzero(blocks)
+    food_positions = np.column_stack((pile_cols, pile_rows)) * FOOD_SIZE
+    return Scenario(width, height, kinds == names.index('wall'), food_positions,
+                    nests=nest_centres(kinds == names.index('nest')))
+
+
+def classify_colors(pixels):
+    # Index into IMAGE_COLORS of the closest colour of every pixel. Images are mostly drawn in the
+    # exact colours, so those are matched by value and only the other pixels are compared by distance.
+    palette = np.array(list(IMAGE_COLORS.values()), dtype=np.int32)
+    codes = (pixels[..., 0].astype(np.int32) << 16) | (pixels[..., 1].astype(np.int32) << 8) | pixels[..., 2]
+    palette_codes = (palette[:, 0] << 16) | (palette[:, 1] << 8) | palette[:, 2]
+    kinds = np.full(codes.shape, -1, dtype=np.int8)
+    for index, code in enumerate(palette_codes):
+        kinds[codes == code] = index
+    other = kinds < 0
+    if other.any():
+        colors = pixels[other].astype(np.int32)
+        kinds[other] = np.argmin([((colors - color) ** 2).sum(axis=1) for color in palette], axis=0)
+    return kinds
+
+
+def nest_centres(mask):
+    # Centre cell of every 8-connected blob of the mask (nests are few and small, so a plain flood fill)
+    remaining = set(zip(*(axis.tolist() for axis in np.nonzero(mask))))
+    centres = []
+    while remaining:
+        blob = [remaining.pop()]
+        index = 0
+        while index < len(blob):
+            y, x = blob[index]
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    if (y + dy, x + dx) in remaining:
+                        remaining.remove((y + dy, x + dx))
+                        blob.append((y + dy, x + dx))
+            index += 1
+        ys, xs = zip(*blob)
+        centres.append((int(round(np.mean(xs))), int(round(np.mean(ys)))))
+    return sorted(centres)
+
+
+def write_image(scenario, path):
+    colors = np.empty((scenario.height, scenario.width, 3), dtype=np.uint8)
+    colors[...] = IMAGE_COLORS['empty']
+    for (x, y), size in zip(scenario.food_positions.astype(int).tolist(), scenario.food_sizes.tolist()):
+        colors[max(y, 0):max(y + size, 0), max(x, 0):max(x + size, 0)] = IMAGE_COLORS['food']
+    for x, y in scenario.nests.tolist():
+        if 0 <= x < scenario.width and 0 <= y < scenario.height:
+            colors[y, x] = IMAGE_COLORS['nest']
+    colors[scenario.solid] = IMAGE_COLORS['wall']  # last, so the obstacle raster always survives
+    pygame.image.save(pygame.surfarray.make_surface(colors.transpose(1, 0, 2)), path)
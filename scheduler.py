@@ -0,0 +1,214 @@
+import copy
+import queue
+import threading
+import time
+import numpy as np
+import pygame
+from colony import Colony
+from obstacle import ObstacleMap
+from pheromone_map import COLONY_COLORS, PheromoneRenderer
+from swarm import Swarm
+
+# Tick rates the Speed button cycles through; None runs as many ticks as the CPU allows
+TICK_RATES = (15, 30, 60, 120, 240, 480, 960, None)
+# Longest backlog of ticks (in seconds) the loop tries to catch up on; anything older is dropped
+MAX_LAG = 0.25
+# Drawing may take at most this share of the time while the simulation is running
+MAX_RENDER_SHARE = 0.5
+
+
+def rate_label(ticks_per_second):
+    return "Speed: max" if ticks_per_second is None else f"Speed: {ticks_per_second}/s"
+
+
+class PheromoneCopy:
+    # Copy of the pheromone fields that draws like a PheromoneMap (or a rival colony's slice of the Grid)
+    def __init__(self, width, height, redraw_every=1, colors=None):
+        self.width = width
+        self.height = height
+        self.redraw_every = redraw_every
+        self.colors = colors
+        self.pheromones = {}
+        self.renderer = None
+
+    def copy_from(self, pheromone_map):
+        for ptype, field in pheromone_map.pheromones.items():
+            target = self.pheromones.get(ptype)
+            if target is None or target.shape != field.shape:
+                self.pheromones[ptype] = field.copy()
+            else:
+                np.copyto(target, field)
+
+    def draw(self, screen, cell_size):
+        if self.renderer is None or self.renderer.cell_size != cell_size:
+            self.renderer = PheromoneRenderer(self, cell_size, self.redraw_every, self.colors)
+        self.renderer.draw(screen)
+
+
+class FrameSnapshot:
+    # Everything Simulation.draw reads, copied between two ticks so a frame is always consistent.
+    # Buffers are reused from one capture to the next.
+    def __init__(self, sim):
+        renderer = sim.pheromone_map.renderer
+        self.pheromone_map = PheromoneCopy(sim.pheromone_map.width, sim.pheromone_map.height,
+                                           renderer.redraw_every if renderer is not None else 1)
+        self.colonies = []
+        self.foods = []
+        self.obstacles = ObstacleMap(sim.obstacles.width, sim.obstacles.height)
+        self.obstacle_version = None
+        self.tick = 0
+
+    def capture(self, sim):
+        if sim.parallel is not None:
+            sim.parallel.gather()
+        self.tick = sim.tick
+        self.pheromone_map.copy_from(sim.pheromone_map)
+        while len(self.colonies) < len(sim.colonies):
+            colony = sim.colonies[len(self.colonies)]
+            swarm = Swarm(colony.nest_position, colony.swarm.grid_width, colony.swarm.grid_height)
+            pheromones = None
+            if colony.colony_id:
+                pheromones = PheromoneCopy(sim.grid.width, sim.grid.height,
+                                           colors=COLONY_COLORS[colony.colony_id % len(COLONY_COLORS)])
+            self.colonies.append(Colony(colony.colony_id, colony.nest_position, swarm, pheromones))
+        for colony, copied in zip(sim.colonies, self.colonies):
+            if copied.pheromones is not None:
+                copied.pheromones.copy_from(colony.pheromones)
+            swarm, n = colony.swarm, colony.swarm.count
+            copied.swarm.count = 0
+            copied.swarm.navigation = swarm.navigation
+            copied.swarm.add_ants(swarm.positions[:n], swarm.headings[:n], swarm.states[:n], swarm.stuck_time[:n])
+        self.foods = [copy.copy(food) for food in sim.foods]
+        if self.obstacle_version != sim.obstacles.version:
+            self.obstacles.set_raster(sim.obstacles.solid)
+            self.obstacle_version = sim.obstacles.version
+
+
+class Scheduler:
+    # Runs a Simulation at a fixed tick rate (sim.ticks_per_second, None for as fast as possible)
+    # independently of the frame rate. Ticks are stepped with a fixed-timestep accumulator; frames
+    # are drawn at most `fps` times a second and less often when drawing would take more than
+    # MAX_RENDER_SHARE of the time, so a slow renderer costs frames, not ticks.
+    #
+    # With threaded=True the ticks run on a worker thread. The main thread handles input and draws
+    # snapshots that the worker copies between two ticks; input is handed to the worker as commands.
+    def __init__(self, sim, fps=60, threaded=False):
+        self.sim = sim
+        self.fps = fps
+        self.threaded = threaded
+        self.draw_cost = 0.0
+        self.commands = queue.Queue()
+        self.frame_wanted = threading.Event()
+        self.frame_ready = threading.Event()
+        self.snapshot = None
+
+    def frame_interval(self):
+        interval = 1 / self.fps
+        if not self.sim.paused:
+            interval = max(interval, self.draw_cost / MAX_RENDER_SHARE)
+        return interval
+
+    def run(self):
+        if self.threaded:
+            self.run_threaded()
+        else:
+            self.run_inline()
+
+    # Grow the backlog of due ticks by `elapsed` seconds; ticks older than MAX_LAG are dropped
+    def add_lag(self, lag, elapsed):
+        if self.sim.paused:
+            return 0.0
+        return min(lag + elapsed, MAX_LAG)
+
+    def run_inline(self):
+        sim = self.sim
+        last = next_frame = time.perf_counter()
+        lag = 0.0
+        while sim.running:
+            sim.handle_events()
+            now = time.perf_counter()
+            lag = self.add_lag(lag, now - last)
+            last = now
+
+            # Step until the backlog is used up or it is time for the next frame
+            rate = sim.ticks_per_second
+            while sim.running and not sim.paused:
+                if rate is not None:
+                    if lag < 1 / rate:
+                        break
+                    lag -= 1 / rate
+                sim.update()
+                if time.perf_counter() >= next_frame:
+                    break
+
+            now = time.perf_counter()
+            if now >= next_frame:
+                sim.notify_observers()
+                finished = time.perf_counter()
+                self.draw_cost = 0.9 * self.draw_cost + 0.1 * (finished - now)
+                next_frame = max(next_frame + self.frame_interval(), finished)
+            elif rate is not None or sim.paused:
+                # Nothing to do until the next tick or frame is due
+                next_tick = now if sim.paused or rate is None else now + 1 / rate - lag
+                time.sleep(max(0.0, min(next_frame, next_tick) - now))
+
+    def run_threaded(self):
+        sim = self.sim
+        self.snapshot = FrameSnapshot(sim)
+        self.snapshot.capture(sim)
+        worker = threading.Thread(target=self.work, name='simulation', daemon=True)
+        worker.start()
+        next_frame = time.perf_counter()
+        self.frame_wanted.set()
+        try:
+            while sim.running:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        sim.running = False
+                    else:
+                        self.commands.put(lambda event=event: sim.handle_event(event))
+
+                # Draw the snapshot once the worker has filled it, then ask for the next one.
+                # The worker only writes the snapshot while a request is open, never during drawing.
+                if self.frame_ready.wait(1 / self.fps):
+                    start = time.perf_counter()
+                    sim.draw(self.snapshot)
+                    self.draw_cost = 0.9 * self.draw_cost + 0.1 * (time.perf_counter() - start)
+                    self.frame_ready.clear()
+                    self.frame_wanted.set()
+
+                next_frame = max(next_frame + 1 / self.fps, time.perf_counter())
+                time.sleep(max(0.0, next_frame - time.perf_counter()))
+        finally:
+            sim.running = False
+            worker.join()
+
+    def work(self):
+        # Worker thread: run commands, publish requested snapshots and step at the target rate
+        sim = self.sim
+        last = time.perf_counter()
+        lag = 0.0
+        while sim.running:
+            while not self.commands.empty():
+                self.commands.get()()
+            if self.frame_wanted.is_set():
+                self.frame_wanted.clear()
+                self.snapshot.capture(sim)
+                for observer in sim.observers:
+                    if observer is not sim.draw_observer:
+                        observer(sim)
+                self.frame_ready.set()
+
+            now = time.perf_counter()
+            lag = self.add_lag(lag, now - last)
+            last = now
+            rate = sim.ticks_per_second
+            if sim.paused:
+                time.sleep(0.002)
+            elif rate is None:
+                sim.update()
+            elif lag >= 1 / rate:
+                lag -= 1 / rate
+                sim.update()
+            else:
+                time.sleep(min(1 / rate - lag, 0.002))
@@ -1,10 +1,19 @@
 import pygame
 import numpy as np
 from grid import Grid
-from ant import Ant
-from food import Food
-from obstacle import Obstacle
-from pheromone_map import PheromoneMap
+from colony import Colony
+from config import SimulationConfig
+from events import ConsoleSink, EventLog, EventType
+from swarm import Swarm
+from food import Food, FoodIndex
+from obstacle import Obstacle, ObstacleMap
+from pheromone_map import PheromoneMap, PheromoneRenderer, PheromoneType
+from tiled_pheromone_map import TiledPheromoneMap
+from parallel import ParallelEngine
+from profiler import Profiler
+from renderer import SceneRenderer, InterfaceRenderer
+from scenario import apply_scenario, load_scenario, save_scenario
+from scheduler import Scheduler, TICK_RATES, rate_label
 
 # window and grid size 
 WIDTH, HEIGHT = 1480, 1000
@@ -13,42 +22,83 @@ SIMULATION_HEIGHT = HEIGHT - UI_HEIGHT
 CELL_SIZE = 10
 GRID_WIDTH = WIDTH // CELL_SIZE
 GRID_HEIGHT = SIMULATION_HEIGHT // CELL_SIZE
-MAX_ANTS = 100
-ANT_SPAWN_RATE = 70
-ANTS_PER_SPAWN = 10
+PHEROMONE_DTYPE = np.float64  # np.float32 halves the memory traffic of the pheromone update
+PHEROMONE_REDRAW_EVERY = 1  # redraw the pheromone layer every k frames
+PROFILE_TICKS = 300  # ticks sampled with cProfile when P is pressed
 
 # This is for creating the buttons for UI elements 
 class Button:
+    font = None  # shared by all buttons, loaded on first use
+
     def __init__(self, x, y, width, height, text, color):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
         self.color = color
+        self.label = None
+        self.label_text = None
 
     # button properties (do not change)
     def draw(self, screen):
         pygame.draw.rect(screen, (0, 0, 0), self.rect)  # Black background
-        font = pygame.font.SysFont('Calibri', 24)  # Calibri font
-        text = font.render(self.text, True, (255, 255, 255))  # White text
-        text_rect = text.get_rect(center=self.rect.center)
-        screen.blit(text, text_rect)
+        if Button.font is None:
+            Button.font = pygame.font.SysFont('Calibri', 24)  # Calibri font
+        if self.label_text != self.text:
+            self.label = Button.font.render(self.text, True, (255, 255, 255))  # White text
+            self.label_text = self.text
+        text_rect = self.label.get_rect(center=self.rect.center)
+        screen.blit(self.label, text_rect)
 
 # main class
 class Simulation:
-    def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        self.clock = pygame.time.Clock()
-        self.grid = Grid(GRID_WIDTH, GRID_HEIGHT, CELL_SIZE)
-        self.pheromone_map = PheromoneMap(GRID_WIDTH, GRID_HEIGHT)
-        self.ants = []
-        self.foods = []
-        self.obstacles = []
+    stats_font = None  # font of the stats overlay, loaded on first use
+
+    def __init__(self, headless=False, seed=None, tiled_pheromones=False, profile_output=None, config=None,
+                 grid_size=None):
+        # Spawning, pheromone and movement settings; see SimulationConfig.DEFAULTS
+        self.config = config if config is not None else SimulationConfig()
+        # The world defaults to filling the window; other sizes (e.g. from a scenario file) get the
+        # largest cell size that fits, and whatever still does not fit is cut off on screen
+        self.grid_width, self.grid_height = grid_size if grid_size is not None else (GRID_WIDTH, GRID_HEIGHT)
+        self.cell_size = max(1, min(WIDTH // self.grid_width, SIMULATION_HEIGHT // self.grid_height))
+        # A headless simulation never touches the pygame display and can run on machines without one
+        self.headless = headless
+        if headless:
+            self.screen = None
+            self.clock = None
+        else:
+            pygame.init()
+            self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+            self.clock = pygame.time.Clock()
+        self.obstacles = ObstacleMap(self.grid_width, self.grid_height)
+        # Rival colonies' pheromones, with the same dtype and obstacle-aware diffusion as the PheromoneMap
+        self.grid = Grid(self.grid_width, self.grid_height, 1, PheromoneType.ALL, PHEROMONE_DTYPE, 'obstacle', self.obstacles)
+        if tiled_pheromones:
+            # Sparse store for very large worlds; its edges reflect but it does not know about obstacles
+            self.pheromone_map = TiledPheromoneMap(self.grid_width, self.grid_height, dtype=PHEROMONE_DTYPE)
+        else:
+            self.pheromone_map = PheromoneMap(self.grid_width, self.grid_height, PHEROMONE_DTYPE, 'obstacle', self.obstacles)
+        self.foods = FoodIndex(self.grid_width, self.grid_height)
         self.running = True
         self.paused = True
         self.spawn_timer = 0
-        self.nest_position = (GRID_WIDTH // 2, GRID_HEIGHT // 2)
+        self.tick = 0
+        self.nest_position = (self.grid_width // 2, self.grid_height // 2)
         self.nest_size = 5
-        self.speed_multiplier = 1
+        self.swarm = Swarm(self.nest_position, self.grid_width, self.grid_height, rng=np.random.default_rng(seed))
+        # Spawns, food pickups and deliveries, depleted food and edits are recorded here and handed to its
+        # sinks in bulk every few ticks; the window prints the rarer ones (rate-limited) to the console
+        self.events = EventLog()
+        if not headless:
+            self.events.add_sink(ConsoleSink())
+        self.swarm.events = self.events
+        self.config.apply_to_swarm(self.swarm)
+        self.config.apply_navigation(self.swarm, self.obstacles, not self.headless)
+        self.config.apply_to_pheromones(self.pheromone_map, self.grid)
+
+        # The first colony uses the PheromoneMap; rival colonies added later share the Grid tensor
+        self.colonies = [Colony(0, self.nest_position, self.swarm, self.pheromone_map)]
+        self.parallel = None
+        self.ticks_per_second = 60  # None runs as many ticks as the CPU allows
 
         # Set up of the buttons
         button_width = 120
@@ -58,28 +108,120 @@ class Simulation:
             'start': Button(button_margin, 10, button_width, button_height, "Start", (0, 255, 0)),
             'food': Button(button_margin*2 + button_width, 10, button_width, button_height, "Food", (255, 255, 0)),
             'obstacle': Button(button_margin*3 + button_width*2, 10, button_width, button_height, "Obstacle", (128, 128, 128)),
-            'speed': Button(button_margin*4 + button_width*3, 10, button_width, button_height, "Speed: 1x", (0, 0, 255))
+            'speed': Button(button_margin*4 + button_width*3, 10, button_width, button_height, rate_label(self.ticks_per_second), (0, 0, 255)),
+            'nest': Button(button_margin*5 + button_width*4, 10, button_width, button_height, "Nest", (139, 69, 19)),
+            'stats': Button(button_margin*6 + button_width*5, 10, button_width, button_height, "Stats", (255, 255, 255))
         }
         self.active_tool = None
 
-    # This is the main loop that runs the simulation
-    def run(self):
-        while self.running:
-            self.handle_events()
-            if not self.paused:
-                for _ in range(self.speed_multiplier):
-                    self.update()
-            self.draw()
-            self.clock.tick(60)
+        # Rolling timings of every phase of update() and draw(); written to profile_output (.csv or .json) at exit
+        self.profiler = Profiler()
+        self.profile_output = profile_output
+        self.show_stats = False
+        self.show_navigation = False  # toggled with N: shades the distance to the nearest nest
+        self.stats_lines = []
+        self.stats_age = 0
+
+        # Observers are called with the simulation once per frame; drawing is just one of them.
+        # Tick observers are called at the end of every update().
+        self.observers = []
+        self.tick_observers = []
+        self.draw_observer = lambda sim: sim.draw()
+        self.scene = None
+        self.interface = None
+        if not headless:
+            self.pheromone_map.renderer = PheromoneRenderer(self.pheromone_map, self.cell_size, PHEROMONE_REDRAW_EVERY)
+            self.add_observer(self.draw_observer)
+
+    # Changes whenever obstacles are added; cached drawings of them are keyed on it
+    @property
+    def obstacle_version(self):
+        return self.obstacles.version
+
+    # Add a rival colony with its own nest and ants; returns its colony id
+    def add_colony(self, nest_position):
+        if self.parallel is not None:
+            raise ValueError("Stop the parallel engine before adding a colony")
+        colony_id = len(self.colonies)
+        swarm = Swarm(nest_position, self.grid_width, self.grid_height,
+                      rng=np.random.default_rng(self.swarm.rng.integers(2**63)))
+        self.config.apply_to_swarm(swarm)
+        self.config.apply_navigation(swarm, self.obstacles, not self.headless)
+        swarm.events, swarm.colony_id = self.events, colony_id
+        self.colonies.append(Colony(colony_id, nest_position, swarm, self.grid.colony_view(colony_id)))
+        return colony_id
+
+    # Move a colony's nest, e.g. to where a scenario puts it; its ants stay where they are
+    def move_nest(self, colony_id, nest_position):
+        colony = self.colonies[colony_id]
+        colony.nest_position = nest_position
+        colony.swarm.nest_position = np.array(nest_position, dtype=float)
+        if colony_id == 0:
+            self.nest_position = nest_position
+        self.config.apply_navigation(colony.swarm, self.obstacles, not self.headless)
+
+    # Run the first colony on worker processes that each own a strip of the world
+    def start_parallel(self, workers=None):
+        if self.parallel is None:
+            self.parallel = ParallelEngine(self, workers)
+
+    def stop_parallel(self):
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def add_tick_observer(self, observer):
+        self.tick_observers.append(observer)
+
+    def remove_tick_observer(self, observer):
+        self.tick_observers.remove(observer)
+
+    def notify_observers(self):
+        for observer in self.observers:
+            observer(self)
+
+    # This is the main loop that runs the simulation: ticks at ticks_per_second, frames at up to fps.
+    # With threaded=True the ticks run on a worker thread and the window draws snapshots of them.
+    def run(self, fps=60, threaded=False):
+        Scheduler(self, fps, threaded).run()
+        self.stop_parallel()
+        self.events.close()
+        if self.profile_output:
+            self.profiler.dump(self.profile_output)
         pygame.quit()
 
     # Handling user inputs like mouse clicks and checking position to place the objects 
     def handle_events(self):
         for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.running = False
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                self.handle_mouse_click(event.pos)
+            self.handle_event(event)
+
+    def handle_event(self, event):
+        if event.type == pygame.QUIT:
+            self.running = False
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            self.handle_mouse_click(event.pos)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_n:
+            self.show_navigation = not self.show_navigation
+            self.refresh_navigation()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_e:
+            path = f"scenario_tick{self.tick}.npz"
+            save_scenario(self, path)
+            self.events.message(f"World saved to {path}")
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+            if self.profiler.start_cprofile(PROFILE_TICKS, f"profile_tick{self.tick}.prof"):
+                self.events.message(f"Profiling the next {PROFILE_TICKS} ticks")
+
+    # Repair the colonies' navigation fields right after an edit rather than in the middle of a tick
+    def refresh_navigation(self):
+        for colony in self.colonies:
+            if colony.swarm.navigation is not None:
+                colony.swarm.navigation.refresh()
 
     # What to do when the user clicks somewhere
     def handle_mouse_click(self, pos):
@@ -90,85 +232,144 @@ class Simulation:
                         self.paused = not self.paused
                         self.buttons['start'].text = "Pause" if not self.paused else "Start"
                     elif button_name == 'speed':
-                        self.speed_multiplier = (self.speed_multiplier % 3) + 1
-                        self.buttons['speed'].text = f"Speed: {self.speed_multiplier}x"
+                        rate = TICK_RATES.index(self.ticks_per_second) if self.ticks_per_second in TICK_RATES else -1
+                        self.ticks_per_second = TICK_RATES[(rate + 1) % len(TICK_RATES)]
+                        self.buttons['speed'].text = rate_label(self.ticks_per_second)
+                    elif button_name == 'stats':
+                        self.show_stats = not self.show_stats
                     else:
                         self.active_tool = button_name
                     return
         else:
             if self.active_tool:
-                grid_x = pos[0] // CELL_SIZE
-                grid_y = (pos[1] - UI_HEIGHT) // CELL_SIZE
+                grid_x = pos[0] // self.cell_size
+                grid_y = (pos[1] - UI_HEIGHT) // self.cell_size
                 if self.active_tool == 'obstacle':
-                    self.obstacles.append(Obstacle(grid_x, grid_y, 3))
+                    self.obstacles.add(Obstacle(grid_x, grid_y, 3))
+                    self.events.record(EventType.OBSTACLE_PLACED, grid_x, grid_y)
+                    self.refresh_navigation()
                 elif self.active_tool == 'food':
-                    new_food = Food(grid_x, grid_y, 3)
-                    self.foods.append(new_food)
-                    print(f"Food placed at {new_food.position}")
+                    self.foods.add(Food(grid_x, grid_y, 3))
+                    self.events.record(EventType.FOOD_PLACED, grid_x, grid_y)
+                elif self.active_tool == 'nest':
+                    self.add_colony((grid_x, grid_y))
+                    self.refresh_navigation()
 
     # Update the state of the simulation
     def update(self):
-        self.spawn_timer += 1
-        if self.spawn_timer >= ANT_SPAWN_RATE and len(self.ants) < MAX_ANTS:
-            self.spawn_ants()
-            self.spawn_timer = 0
+        profiler = self.profiler
+        with profiler.phase('update'):
+            self.tick += 1
+            self.events.tick = self.tick
+            self.spawn_timer += 1
+            if self.spawn_timer >= self.config.ant_spawn_rate:
+                with profiler.phase('spawn'):
+                    self.spawn_ants()
+                self.spawn_timer = 0
+
+            if self.parallel is not None:
+                with profiler.phase('ants'):
+                    self.parallel.step()
+            else:
+                with profiler.phase('ants'):
+                    for colony in self.colonies:
+                        colony.swarm.step(colony.pheromones, self.foods, self.obstacles)
+
+                with profiler.phase('pheromones'):
+                    self.pheromone_map.update()
+                if len(self.colonies) > 1:
+                    with profiler.phase('grid'):
+                        self.grid.update()
 
-        for ant in self.ants:
-            ant.move(self.grid, self.pheromone_map, self.foods, self.obstacles)
+                with profiler.phase('food_cleanup'):
+                    self.remove_depleted_food()
 
-        self.pheromone_map.update()
+            for observer in self.tick_observers:
+                observer(self)
+            self.events.end_tick(self.tick)
 
-        for food in self.foods[:]:
-            if food.is_empty():
-                print(f"Food at {food.position} is depleted")
-                self.foods.remove(food)
+        report = profiler.tick()
+        if report:
+            self.events.message(report)
 
-    # Creating new ants at the ant nest
+    def remove_depleted_food(self):
+        for food in self.foods.remove_depleted():
+            self.events.record(EventType.FOOD_DEPLETED, *food.position)
+
+    # Creating new ants at every nest that is below max_ants
     def spawn_ants(self):
-        x, y = self.nest_position
-        for _ in range(ANTS_PER_SPAWN):
-            if len(self.ants) < MAX_ANTS:
-                new_ant = Ant(x, y, self.nest_position, GRID_WIDTH, GRID_HEIGHT)
-                self.ants.append(new_ant)
-        print(f"Spawned {ANTS_PER_SPAWN} ants. Total ants: {len(self.ants)}")
-
-    # Draw everything on the screen
-    def draw(self):
-        self.screen.fill((255, 255, 255))
-
-        simulation_surface = pygame.Surface((WIDTH, SIMULATION_HEIGHT))
-        simulation_surface.fill((255, 255, 255))
-
-        self.pheromone_map.draw(simulation_surface, CELL_SIZE)
-
-        # Draw the nest
-        nest_color = (139, 69, 19)
-        nest_points = [
-            (self.nest_position[0] * CELL_SIZE, self.nest_position[1] * CELL_SIZE),
-            ((self.nest_position[0] + self.nest_size) * CELL_SIZE, self.nest_position[1] * CELL_SIZE),
-            ((self.nest_position[0] + self.nest_size // 2) * CELL_SIZE,
-             (self.nest_position[1] - self.nest_size) * CELL_SIZE)
-        ]
-        pygame.draw.polygon(simulation_surface, nest_color, nest_points)
-
-        # Draw food, obstacles, and ants
-        for food in self.foods:
-            food.draw(simulation_surface, CELL_SIZE)
-        for obstacle in self.obstacles:
-            obstacle.draw(simulation_surface, CELL_SIZE)
-        for ant in self.ants:
-            ant.draw(simulation_surface, CELL_SIZE)
-
-        self.screen.blit(simulation_surface, (0, UI_HEIGHT))
-
-        # Draw the UI
-        pygame.draw.rect(self.screen, (200, 200, 200), (0, 0, WIDTH, UI_HEIGHT))
-        for button in self.buttons.values():
-            button.draw(self.screen)
-
-        pygame.display.flip()
+        max_ants = self.config.max_ants
+        for colony in self.colonies:
+            size = self.parallel.ant_count if self.parallel is not None else len(colony.swarm)
+            if size < max_ants:
+                x, y = colony.nest_position
+                count = min(self.config.ants_per_spawn, max_ants - size)
+                if self.parallel is not None:
+                    self.parallel.spawn(count, x, y)
+                else:
+                    colony.swarm.spawn(count, x, y)
+                self.events.record(EventType.ANT_SPAWNED, x, y, colony.colony_id, count)
+
+    # Draw everything on the screen, from the simulation itself or from a FrameSnapshot of it
+    def draw(self, state=None):
+        profiler = self.profiler
+        with profiler.phase('draw'):
+            if state is None:
+                if self.parallel is not None:
+                    self.parallel.gather()
+                state = self
+            self.draw_frame(profiler, state)
+
+    def draw_frame(self, profiler, state):
+        # The world and the UI bar are drawn by renderers that keep their surfaces between frames
+        if self.scene is None:
+            self.scene = SceneRenderer(WIDTH, SIMULATION_HEIGHT, self.cell_size, self.nest_size)
+            self.interface = InterfaceRenderer(WIDTH, UI_HEIGHT)
+        self.screen.blit(self.scene.draw(state, state.obstacle_version, profiler, self.show_navigation), (0, UI_HEIGHT))
+
+        with profiler.phase('draw_ui'):
+            self.screen.blit(self.interface.draw(self.buttons), (0, 0))
+            if self.show_stats:
+                self.draw_stats()
+
+        with profiler.phase('flip'):
+            pygame.display.flip()
+
+    # Phase timings (p50/p95/max in ms) in columns of four rows, right of the buttons.
+    # The text is only re-rendered every 30 frames; percentiles over the window change slowly.
+    def draw_stats(self):
+        self.stats_age += 1
+        if not self.stats_lines or self.stats_age >= 30:
+            if Simulation.stats_font is None:
+                Simulation.stats_font = pygame.font.SysFont('Calibri', 15)
+            font = Simulation.stats_font
+            self.stats_lines = [font.render(f"{name} {values['p50']:.1f}/{values['p95']:.1f}/{values['max']:.1f} ms",
+                                            True, (0, 0, 0))
+                                for name, values in self.profiler.stats().items()]
+            self.stats_age = 0
+        left = self.buttons['stats'].rect.right + 10
+        column_width = (WIDTH - left) // 3
+        for index, line in enumerate(self.stats_lines):
+            column, row = divmod(index, 4)
+            self.screen.blit(line, (left + column * column_width, 2 + row * 14))
 
 # Start the simulation
 if __name__ == "__main__":
-    sim = Simulation()
-    sim.run()
+    import argparse
+    parser = argparse.ArgumentParser(description="Interactive ant simulation.")
+    parser.add_argument('profile_output', nargs='?', help="write per-phase timings here (.csv or .json) at exit")
+    parser.add_argument('--tps', type=int, default=60, help="ticks per second, 0 for as fast as possible")
+    parser.add_argument('--fps', type=int, default=60, help="maximum frames per second")
+    parser.add_argument('--threaded', action='store_true', help="run the ticks on a worker thread")
+    parser.add_argument('--scenario', metavar='PATH', help="start from a scenario file (.png, .npz or .json)")
+    args = parser.parse_args()
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+        sim = Simulation(profile_output=args.profile_output, config=scenario.simulation_config(),
+                         grid_size=scenario.grid_size)
+        apply_scenario(sim, scenario, settings=False)
+    else:
+        sim = Simulation(profile_output=args.profile_output)
+    sim.ticks_per_second = args.tps or None
+    sim.buttons['speed'].text = rate_label(sim.ticks_per_second)
+    sim.run(args.fps, args.threaded)
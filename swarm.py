@@ -0,0 +1,189 @@
+import numpy as np
+from ant import Ant
+from backend import NUMPY
+from events import EventType
+
+class Swarm:
+    # Keeps every ant of a colony in contiguous arrays and moves them all in one batched step
+    # Tunable movement parameters, shared by every ant in the swarm
+    PARAMETERS = ('speed', 'sensor_offset_distance', 'sensor_angle_offset', 'max_turn_angle',
+                  'random_movement_chance', 'stuck_limit', 'nest_radius')
+
+    def __init__(self, nest_position, grid_width, grid_height, capacity=256, rng=None):
+        self.nest_position = np.array(nest_position, dtype=float)
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = 0
+        self.positions = np.zeros((capacity, 2))
+        self.headings = np.zeros(capacity)
+        self.states = np.zeros(capacity, dtype=np.int8)
+        self.stuck_time = np.zeros(capacity, dtype=np.int32)
+        self.food_delivered = 0
+
+        # Movement parameters shared by every ant in the swarm
+        self.speed = 1.0
+        self.sensor_offset_distance = 3.0
+        self.sensor_angle_offset = np.pi / 6
+        self.max_turn_angle = np.pi / 4
+        self.random_movement_chance = 0.3
+        self.stuck_limit = 10
+        self.nest_radius = 1.0
+        # Optional NavigationField that steers returning ants around obstacles
+        self.navigation = None
+        # Compute backend running the per-tick kernels (see backend.py)
+        self.backend = NUMPY
+        # Optional EventLog that food pickups and deliveries are recorded in, in bulk, as this colony
+        self.events = None
+        self.colony_id = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield Ant(self, index)
+
+    def ant(self, index):
+        # Thin object view of a single ant, for drawing and debugging
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return Ant(self, index)
+
+    def spawn(self, count, x, y):
+        # Add new exploring ants at (x, y) with random headings
+        self.reserve(self.count + count)
+        new = slice(self.count, self.count + count)
+        self.positions[new] = (x, y)
+        self.headings[new] = self.rng.uniform(-np.pi, np.pi, count)
+        self.states[new] = Ant.EXPLORING
+        self.stuck_time[new] = 0
+        self.count += count
+
+    def reserve(self, capacity):
+        # Grow the arrays (doubling) so that at least `capacity` ants fit
+        if capacity <= len(self.headings):
+            return
+        new_capacity = max(capacity, 2 * len(self.headings))
+        self.positions = self._grow(self.positions, new_capacity)
+        self.headings = self._grow(self.headings, new_capacity)
+        self.states = self._grow(self.states, new_capacity)
+        self.stuck_time = self._grow(self.stuck_time, new_capacity)
+
+    @staticmethod
+    def _grow(array, capacity):
+        grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def add_ants(self, positions, headings, states, stuck_time):
+        # Append ants given as arrays, e.g. ants migrating in from another swarm
+        count = len(headings)
+        self.reserve(self.count + count)
+        new = slice(self.count, self.count + count)
+        self.positions[new] = positions
+        self.headings[new] = headings
+        self.states[new] = states
+        self.stuck_time[new] = stuck_time
+        self.count += count
+
+    def remove_ants(self, mask):
+        # Remove the masked ants, compacting the arrays, and return them as (positions, headings, states, stuck_time)
+        keep = ~mask
+        removed = (self.positions[:self.count][mask], self.headings[:self.count][mask],
+                   self.states[:self.count][mask], self.stuck_time[:self.count][mask])
+        kept = int(np.count_nonzero(keep))
+        for array in (self.positions, self.headings, self.states, self.stuck_time):
+            array[:kept] = array[:self.count][keep]
+        self.count = kept
+        return removed
+
+    def step(self, pheromone_map, foods, obstacles):
+        # Advance the whole colony by one tick
+        if self.count == 0:
+            return
+
+        # Exploring ants pick up food from the closest pile in range
+        if foods:
+            self.collect_food(foods)
+        self.advance(pheromone_map, obstacles)
+
+    def advance(self, pheromone_map, obstacles):
+        # Everything in a tick after food pickup: steering, moving, marking and nest drop-off
+        n = self.count
+        if n == 0:
+            return
+        positions = self.positions[:n]
+        headings = self.headings[:n]
+        states = self.states[:n]
+
+        # Random numbers for the tick are drawn up front in one batch
+        random_rolls = self.rng.random(n)
+        random_angles = self.rng.uniform(-np.pi, np.pi, (3, n))
+
+        # Steer, move and leave pheromone trails, with the swarm's compute backend
+        self.backend.move_ants(self, pheromone_map, obstacles, self.nest_headings(), random_rolls, random_angles)
+        self.backend.deposit_trails(pheromone_map, positions, states)
+        exploring = states == Ant.EXPLORING
+
+        # Returning ants that reached the nest drop their food
+        offsets = positions - self.nest_position
+        arrived = ~exploring & (np.hypot(offsets[:, 0], offsets[:, 1]) < self.nest_radius)
+        states[arrived] = Ant.EXPLORING
+        headings[arrived] = random_angles[2, arrived]
+        self.food_delivered += int(np.count_nonzero(arrived))
+        if self.events is not None:
+            self.events.record_many(EventType.FOOD_DELIVERED, positions[arrived], self.colony_id)
+
+    def nest_headings(self):
+        # Heading from every ant to the nest: straight there, or along the navigation field where it has one
+        offsets = self.nest_position - self.positions[:self.count]
+        straight = np.arctan2(offsets[:, 1], offsets[:, 0])
+        if self.navigation is None:
+            return straight
+        field = self.navigation.headings_at(self.positions[:self.count])
+        return np.where(np.isnan(field), straight, field)
+
+    def sense_pheromones(self, pheromone_map, pheromone_type, mask):
+        # Check pheromones in three directions (left, center, right) for the masked ants
+        positions = self.positions[:self.count][mask]
+        headings = self.headings[:self.count][mask]
+        offsets = (-self.sensor_angle_offset, 0.0, self.sensor_angle_offset)
+        strengths = []
+        for offset in offsets:
+            angles = headings + offset
+            sensors = positions + self.sensor_offset_distance * np.column_stack((np.cos(angles), np.sin(angles)))
+            strengths.append(pheromone_map.get_pheromone_strengths(sensors, pheromone_type))
+        left, center, right = strengths
+
+        # Choose direction based on pheromone strength
+        return np.where(center >= np.maximum(left, right), headings,
+                        np.where(left > right, headings - self.sensor_angle_offset,
+                                 headings + self.sensor_angle_offset))
+
+    def valid_positions(self, positions, obstacles):
+        # Check which positions are within the grid and not inside an obstacle
+        valid = ((positions[:, 0] >= 0) & (positions[:, 0] < self.grid_width) &
+                 (positions[:, 1] >= 0) & (positions[:, 1] < self.grid_height))
+        valid &= ~obstacles.are_solid(positions)
+        return valid
+
+    def collect_food(self, foods):
+        # Exploring ants within sensor range of a food pile try to take one unit from the closest one
+        claimants, piles = self.food_claims(foods)
+        self.grant_food(claimants[foods.take(piles)])
+
+    def food_claims(self, foods):
+        # Exploring ants with a food pile in sensor range, and the index of the closest pile for each
+        explorers = np.flatnonzero(self.states[:self.count] == Ant.EXPLORING)
+        closest = foods.nearest(self.positions[explorers], self.sensor_offset_distance)
+        in_range = closest >= 0
+        return explorers[in_range], closest[in_range]
+
+    def grant_food(self, collectors):
+        # Ants that got food turn around and head for the nest
+        self.states[collectors] = Ant.RETURNING
+        offsets = self.nest_position - self.positions[collectors]
+        self.headings[collectors] = np.arctan2(offsets[:, 1], offsets[:, 0])
+        if self.events is not None:
+            self.events.record_many(EventType.FOOD_TAKEN, self.positions[collectors], self.colony_id)
@@ -0,0 +1,23 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pytest
+from ant import Ant
+from config import SimulationConfig
+from food import Food
+from simulation import Simulation
+
+
+# Draw a few ticks in the window (on SDL's dummy video driver) for grids whose cells are several
+# pixels, two pixels and one pixel wide, with ants in both states
+@pytest.mark.parametrize('grid_size', [(148, 94), (600, 400), (2048, 2048)])
+def test_window_draws(grid_size):
+    sim = Simulation(grid_size=grid_size, seed=1, config=SimulationConfig(nest_navigation=False))
+    sim.foods.add(Food(sim.nest_position[0] + 2, sim.nest_position[1], 3))
+    sim.spawn_ants()
+    sim.swarm.states[:sim.swarm.count:2] = Ant.RETURNING
+    sim.paused = False
+    for _ in range(3):
+        sim.update()
+        sim.draw()
+    assert sim.swarm.count > 0
@@ -0,0 +1,191 @@
+import numpy as np
+from pheromone_map import PheromoneType, PheromoneRenderer
+
+class TiledPheromoneMap:
+    # Sparse pheromone store for very large worlds. The map is cut into square tiles that are
+    # only allocated where pheromone has been deposited, updated while they hold any, and freed
+    # again once every value has fallen below `cutoff`. Map edges reflect, like PheromoneMap.
+    def __init__(self, width, height, tile_size=64, dtype=np.float32, cutoff=1e-4):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.dtype = np.dtype(dtype)
+        self.cutoff = cutoff
+        self.evaporation_rate = 0.995
+        self.diffusion_rate = 0.1
+        self.tiles_x = -(-width // tile_size)
+        self.tiles_y = -(-height // tile_size)
+        self.tiles = {}
+        self.pool = []
+        self.renderer = None
+
+        # Scratch buffers for one padded tile (with a one cell halo) and its neighbour sum
+        layers = len(PheromoneType.ALL)
+        self.padded = np.zeros((layers, tile_size + 2, tile_size + 2), dtype=self.dtype)
+        self.neighbours = np.zeros((layers, tile_size, tile_size), dtype=self.dtype)
+
+    @property
+    def tile_count(self):
+        return len(self.tiles)
+
+    @property
+    def memory_bytes(self):
+        tile_bytes = len(PheromoneType.ALL) * self.tile_size * self.tile_size * self.dtype.itemsize
+        return (len(self.tiles) + len(self.pool)) * tile_bytes
+
+    def stats(self):
+        return {
+            'live_tiles': self.tile_count,
+            'pooled_tiles': len(self.pool),
+            'memory_bytes': self.memory_bytes,
+            'dense_bytes': len(PheromoneType.ALL) * self.width * self.height * self.dtype.itemsize,
+        }
+
+    def new_tile(self):
+        if self.pool:
+            tile = self.pool.pop()
+            tile.fill(0)
+            return tile
+        return np.zeros((len(PheromoneType.ALL), self.tile_size, self.tile_size), dtype=self.dtype)
+
+    def tile_extent(self, key):
+        # Rows and columns of a tile that lie inside the map (edge tiles can be partial)
+        tile_y, tile_x = key
+        return (min(self.tile_size, self.height - tile_y * self.tile_size),
+                min(self.tile_size, self.width - tile_x * self.tile_size))
+
+    def cell_indices(self, positions):
+        x, y = positions[:, 0].astype(int), positions[:, 1].astype(int)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        return x[inside], y[inside], inside
+
+    def deposit_pheromone(self, position, pheromone_type, amount=1.0):
+        # Add pheromones to a specific location
+        self.deposit_pheromones(np.array([position], dtype=float), pheromone_type, amount)
+
+    def deposit_pheromones(self, positions, pheromone_type, amount=1.0):
+        # Batched deposit; the positions are grouped by tile and each tile is written once
+        x, y, _ = self.cell_indices(positions)
+        if len(x) == 0:
+            return
+        keys = (y // self.tile_size) * self.tiles_x + x // self.tile_size
+        touched, groups = np.unique(keys, return_inverse=True)
+        for group, key in enumerate(touched):
+            tile_key = divmod(int(key), self.tiles_x)
+            tile = self.tiles.get(tile_key)
+            if tile is None:
+                tile = self.tiles[tile_key] = self.new_tile()
+            members = groups == group
+            np.add.at(tile[pheromone_type], (y[members] % self.tile_size, x[members] % self.tile_size), amount)
+
+    def get_pheromone_strength(self, position, pheromone_type):
+        # Get the strength of pheromones at a specific location
+        return float(self.get_pheromone_strengths(np.array([position], dtype=float), pheromone_type)[0])
+
+    def get_pheromone_strengths(self, positions, pheromone_type):
+        # Batched lookup; cells outside the map or in unallocated tiles read 0
+        strengths = np.zeros(len(positions))
+        x, y, inside = self.cell_indices(positions)
+        if len(x) == 0 or not self.tiles:
+            return strengths
+        keys = (y // self.tile_size) * self.tiles_x + x // self.tile_size
+        values = np.zeros(len(x))
+        touched, groups = np.unique(keys, return_inverse=True)
+        for group, key in enumerate(touched):
+            tile = self.tiles.get(divmod(int(key), self.tiles_x))
+            if tile is not None:
+                members = groups == group
+                values[members] = tile[pheromone_type, y[members] % self.tile_size, x[members] % self.tile_size]
+        strengths[inside] = values
+        return strengths
+
+    def update(self):
+        # Evaporate and diffuse every live tile. Halos are read from the neighbouring tiles of the
+        # previous step, so all new tiles are computed before any of them replaces the old ones.
+        self.activate_neighbours()
+        self_weight = self.evaporation_rate * (1 - self.diffusion_rate)
+        neighbour_weight = self.evaporation_rate * self.diffusion_rate / 8
+        updated = {}
+        for key, tile in self.tiles.items():
+            rows, cols = self.tile_extent(key)
+            padded = self.padded[:, :rows + 2, :cols + 2]
+            self.fill_halo(key, tile, padded, rows, cols)
+            neighbours = self.neighbours[:, :rows, :cols]
+            np.add(padded[:, :-2, 1:-1], padded[:, 2:, 1:-1], out=neighbours)
+            neighbours += padded[:, 1:-1, :-2]
+            neighbours += padded[:, 1:-1, 2:]
+            neighbours *= neighbour_weight
+            new_tile = self.new_tile()
+            center = new_tile[:, :rows, :cols]
+            np.multiply(tile[:, :rows, :cols], self_weight, out=center)
+            center += neighbours
+            updated[key] = new_tile
+
+        # Recycle the old tiles, then free the ones that have faded out
+        self.pool.extend(self.tiles.values())
+        self.tiles = {}
+        for key, tile in updated.items():
+            if tile.max() < self.cutoff:
+                self.pool.append(tile)
+            else:
+                self.tiles[key] = tile
+
+        # Keep only as many spare tiles as the next update needs, release the rest
+        del self.pool[len(self.tiles):]
+
+    def fill_halo(self, key, tile, padded, rows, cols):
+        # Copy the tile into the middle of `padded` and its neighbours' edges into the halo.
+        # Map edges reflect (the halo repeats the tile's own edge); missing tiles read 0.
+        tile_y, tile_x = key
+        padded[:, 1:-1, 1:-1] = tile[:, :rows, :cols]
+        above, below = self.tiles.get((tile_y - 1, tile_x)), self.tiles.get((tile_y + 1, tile_x))
+        left, right = self.tiles.get((tile_y, tile_x - 1)), self.tiles.get((tile_y, tile_x + 1))
+        if tile_y == 0:
+            padded[:, 0, 1:-1] = tile[:, 0, :cols]
+        else:
+            padded[:, 0, 1:-1] = above[:, -1, :cols] if above is not None else 0
+        if tile_y == self.tiles_y - 1:
+            padded[:, -1, 1:-1] = tile[:, rows - 1, :cols]
+        else:
+            padded[:, -1, 1:-1] = below[:, 0, :cols] if below is not None else 0
+        if tile_x == 0:
+            padded[:, 1:-1, 0] = tile[:, :rows, 0]
+        else:
+            padded[:, 1:-1, 0] = left[:, :rows, -1] if left is not None else 0
+        if tile_x == self.tiles_x - 1:
+            padded[:, 1:-1, -1] = tile[:, :rows, cols - 1]
+        else:
+            padded[:, 1:-1, -1] = right[:, :rows, 0] if right is not None else 0
+
+    def activate_neighbours(self):
+        # Allocate empty tiles next to live ones whose shared edge holds pheromone above the cutoff
+        wanted = set()
+        for (tile_y, tile_x), tile in self.tiles.items():
+            edges = ((tile_y - 1, tile_x, tile[:, 0, :]), (tile_y + 1, tile_x, tile[:, -1, :]),
+                     (tile_y, tile_x - 1, tile[:, :, 0]), (tile_y, tile_x + 1, tile[:, :, -1]))
+            for neighbour_y, neighbour_x, edge in edges:
+                neighbour = (neighbour_y, neighbour_x)
+                if (0 <= neighbour_y < self.tiles_y and 0 <= neighbour_x < self.tiles_x and
+                        neighbour not in self.tiles and edge.max() >= self.cutoff):
+                    wanted.add(neighbour)
+        for key in wanted:
+            self.tiles[key] = self.new_tile()
+
+    def to_dense(self, pheromone_type):
+        # Dense (height, width) copy of one pheromone type, for drawing and analysis
+        dense = np.zeros((self.height, self.width), dtype=self.dtype)
+        for key, tile in self.tiles.items():
+            rows, cols = self.tile_extent(key)
+            y0, x0 = key[0] * self.tile_size, key[1] * self.tile_size
+            dense[y0:y0 + rows, x0:x0 + cols] = tile[pheromone_type, :rows, :cols]
+        return dense
+
+    @property
+    def pheromones(self):
+        return {ptype: self.to_dense(ptype) for ptype in PheromoneType.ALL}
+
+    def draw(self, screen, cell_size):
+        # Visualizing the pheromone trails on the screen (densifies the map, so meant for small worlds)
+        if self.renderer is None or self.renderer.cell_size != cell_size:
+            self.renderer = PheromoneRenderer(self, cell_size)
+        self.renderer.draw(screen)